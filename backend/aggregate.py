@@ -0,0 +1,186 @@
+from constants import AGGREGATE_CACHE_SIZE, AGGREGATE_CACHE_TTL
+from tables import read_table
+from cache import LRUCache
+
+import math
+
+import numpy as np
+
+TABLE_COLLECTIONS = {"Sample", "Assay"}
+
+def numeric(values: "pd.Series"):
+
+    """
+    `values` as floats (NaN where empty) if every non-empty value is a number, otherwise None.
+    """
+
+    import pandas as pd
+
+    values = values.replace("", np.nan)
+    numbers = pd.to_numeric(values, errors="coerce")
+
+    if values.isna().all() or numbers.isna().sum() > values.isna().sum():
+        return None
+
+    return numbers
+
+def value_counts(values: "pd.Series") -> list:
+
+    """
+    `[{"name", "value"}]` per distinct value, most frequent first, like `datavis.create_pie_chart`.
+    """
+
+    counts = values.fillna("N/A").astype(str).value_counts(sort=True)
+
+    return [{"name": name, "value": int(count)} for name, count in counts.items()]
+
+def bin_edges(numbers: np.ndarray, bins: int = None, width: float = None) -> np.ndarray:
+
+    """
+    Fixed-width bin edges. With neither `bins` nor `width`, bins are one unit wide
+    between the floor of the minimum and the ceiling of the maximum, like
+    `datavis.create_histogram`.
+    """
+
+    if numbers.size == 0:
+        return np.array([0.0, 1.0])
+
+    low, high = float(numbers.min()), float(numbers.max())
+
+    if bins is not None:
+        return np.linspace(low, high if high > low else low + 1, bins + 1)
+
+    width = width or 1.0
+    start = math.floor(low / width) * width
+    count = max(1, math.ceil((high - start) / width))
+
+    if start + count * width < high:
+        count += 1
+
+    return start + width * np.arange(count + 1)
+
+def histogram(numbers: np.ndarray, edges: np.ndarray) -> dict:
+
+    counts, _ = np.histogram(numbers, bins=edges)
+
+    return {
+        "edges": edges.tolist(),
+        "counts": counts.tolist(),
+        "data": [
+            {"name": f"{edges[i]:g}-{edges[i + 1]:g}", "value": int(count)}
+            for i, count in enumerate(counts)
+        ],
+    }
+
+class Aggregates:
+
+    """
+    Server-side counts and histograms over the columnar Sample/Assay tables.
+
+    Only the requested columns are read (see `tables.read_table`), the maths is
+    done in pandas/NumPy, and each result is cached per (collection, accession,
+    column, group-by column, bin spec) until the study is rewritten.
+    """
+
+    def __init__(self, max_size: int = AGGREGATE_CACHE_SIZE, ttl: float = AGGREGATE_CACHE_TTL):
+        self._cache = LRUCache(max_size=max_size, ttl=ttl)
+
+    def aggregate(self, collection: str, accession: str, column: str, by: str = None, bins: int = None, width: float = None) -> dict:
+
+        """
+        Value counts for a categorical `column` or a histogram for a numeric one,
+        optionally per value of the `by` column (e.g. a factor). Raises KeyError
+        for an unknown study or column and ValueError for a bad request.
+        """
+
+        if collection not in TABLE_COLLECTIONS:
+            raise ValueError(f"Aggregates are only available for {', '.join(sorted(TABLE_COLLECTIONS))}")
+
+        if bins is not None and bins < 1 or width is not None and width <= 0:
+            raise ValueError("bins and width must be positive")
+
+        key = (collection, accession, column, by, bins, width)
+        cached = self._cache.get(key)
+
+        if cached is not None:
+            return cached
+
+        result = self._compute(collection, accession, column, by, bins, width)
+        self._cache.set(key, result)
+
+        return result
+
+    def invalidate(self, accession: str) -> int:
+        return self._cache.invalidate_where(lambda key: key[1] == accession)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+    def _compute(self, collection, accession, column, by, bins, width) -> dict:
+
+        # Imported on the first aggregate rather than with the servers, which start without pandas
+        import pandas as pd
+
+        wanted = [column] if by is None else [column, by]
+        table = read_table(collection, accession, wanted)
+
+        if table is None:
+            raise KeyError(f"No {collection} table for {accession}")
+
+        missing = [name for name in wanted if name not in table["columns"]]
+
+        if missing:
+            raise KeyError(f"Unknown column: {missing[0]}")
+
+        frame = pd.DataFrame(table["columns"])
+        values = numeric(frame[column])
+        numbers = None if values is None else values.dropna().to_numpy(dtype=float)
+
+        result = {
+            "accession": accession,
+            "column": column,
+            "rows": len(frame),
+            "kind": "counts" if numbers is None else "histogram",
+        }
+
+        if by is None:
+
+            if numbers is None:
+                result["data"] = value_counts(frame[column])
+            else:
+                result.update(histogram(numbers, bin_edges(numbers, bins, width)))
+
+            return result
+
+        result["by"] = by
+        groups = frame[by].fillna("N/A").astype(str)
+
+        if numbers is None:
+
+            # One crosstab over the whole table rather than a value_counts per group
+            counts = pd.crosstab(groups, frame[column].fillna("N/A").astype(str))
+
+            result["groups"] = {
+                group: [{"name": name, "value": int(count)} for name, count in row.sort_values(ascending=False).items() if count]
+                for group, row in counts.iterrows()
+            }
+
+            return result
+
+        # Shared edges so the groups' histograms line up; one pass bins every row into a (group, bin) grid
+        edges = bin_edges(numbers, bins, width)
+        codes, names = pd.factorize(groups)
+
+        present = values.notna().to_numpy()
+        positions = np.searchsorted(edges, values.to_numpy(dtype=float)[present], side="right") - 1
+        positions = np.clip(positions, 0, len(edges) - 2)
+
+        grid = np.zeros((len(names), len(edges) - 1), dtype=np.int64)
+        np.add.at(grid, (codes[present], positions), 1)
+
+        result["edges"] = edges.tolist()
+        result["groups"] = {name: grid[i].tolist() for i, name in enumerate(names)}
+
+        return result
+
+AGGREGATES = Aggregates()
@@ -0,0 +1,381 @@
+"""
+Async serving mode for the API, built on aiohttp.
+
+Serves the same routes as server.py. Handlers never block the event loop:
+Firestore and Pinecone calls run on the shared I/O executor, embeddings are
+queued on the embedding service's batching thread and Groq is called through
+one pooled AsyncGroq client. Each route group has a concurrency limit; a
+request that cannot start within ROUTE_QUEUE_TIMEOUT seconds gets a 503.
+
+    python async_server.py --port 5000
+"""
+
+from constants import ROUTE_CONCURRENCY, ROUTE_QUEUE_TIMEOUT
+from chatbot import chatbot_async, chatbot_stream_async, chatbot_specific_async, chatbot_specific_stream_async, cache_stats
+from service import initialize, refresh_study, aggregate_args, summary_row, format_table, CORS_ORIGINS, CHAT_ERROR, SUMMARY_FIELDS, MAX_PAGE_SIZE
+from clients import IO_EXECUTOR
+from summary_index import SUMMARIES
+from aggregate import AGGREGATES
+from metrics import METRICS
+from db import DB
+
+import contextvars
+import itertools
+import argparse
+import asyncio
+import time
+import json
+
+from aiohttp import web
+
+ROUTE_LIMITS = web.AppKey("route_limits", dict)
+
+def limited(group):
+
+    """
+    Run the handler under the concurrency limit of `group` (a ROUTE_CONCURRENCY key).
+    """
+
+    def decorator(handler):
+
+        async def wrapper(request):
+
+            semaphore = request.app[ROUTE_LIMITS][group]
+
+            try:
+                await asyncio.wait_for(semaphore.acquire(), ROUTE_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                return web.json_response({'error': 'Server busy, try again later.'}, status=503)
+
+            try:
+                return await handler(request)
+            finally:
+                semaphore.release()
+
+        return wrapper
+
+    return decorator
+
+async def run_blocking(function, *args):
+
+    # Run in a copy of the request's context, so spans recorded on the executor join its trace
+    context = contextvars.copy_context()
+
+    return await asyncio.get_running_loop().run_in_executor(IO_EXECUTOR, context.run, function, *args)
+
+async def iterate_blocking(iterator, chunk_size=100):
+
+    """
+    Drain a blocking iterator from the I/O executor, `chunk_size` items per hop.
+    """
+
+    while True:
+
+        chunk = await run_blocking(lambda: list(itertools.islice(iterator, chunk_size)))
+
+        if not chunk:
+            return
+
+        for item in chunk:
+            yield item
+
+@web.middleware
+async def cors_middleware(request, handler):
+
+    origin = request.headers.get('Origin')
+
+    if request.method == 'OPTIONS':
+        response = web.Response()
+    else:
+        response = await handler(request)
+
+    if origin in CORS_ORIGINS:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+        response.headers['Vary'] = 'Origin'
+
+    return response
+
+@web.middleware
+async def metrics_middleware(request, handler):
+
+    resource = request.match_info.route.resource
+    route = resource.canonical if resource is not None else 'unmatched'
+    token = METRICS.start_trace(method=request.method, path=request.path)
+    start = time.perf_counter()
+    status = 500
+
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        METRICS.request_finished(route, request.method, status, time.perf_counter() - start)
+        METRICS.finish_trace(token, route=route, status=status)
+
+@limited("documents")
+async def add_document(request):
+    collection_name = request.match_info['collection_name']
+    document_data = await request.json()
+    if not document_data:
+        return web.json_response({'error': 'No data provided.'}, status=400)
+    document_id = document_data.get('id')
+    await run_blocking(DB.add_document, collection_name, document_data, document_id)
+    if document_id:
+        await run_blocking(refresh_study, collection_name, document_id)
+        return web.json_response({'message': f'Document {document_id} added successfully.'}, status=201)
+    return web.json_response({'message': 'Document added successfully with auto-generated ID.'}, status=201)
+
+@limited("documents")
+async def get_document(request):
+    data = await run_blocking(DB.get_document, request.match_info['collection_name'], request.match_info['document_id'])
+    if data:
+        return web.json_response(data)
+    return web.json_response({'error': 'Document not found'}, status=404)
+
+@limited("documents")
+async def update_document(request):
+    collection_name = request.match_info['collection_name']
+    document_id = request.match_info['document_id']
+    updates = await request.json()
+    if not updates:
+        return web.json_response({'error': 'No update data provided.'}, status=400)
+    try:
+        await run_blocking(DB.update_document, collection_name, document_id, updates)
+        await run_blocking(refresh_study, collection_name, document_id)
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=400)
+    return web.json_response({'message': f'Document {document_id} updated successfully.'})
+
+@limited("documents")
+async def delete_document(request):
+    collection_name = request.match_info['collection_name']
+    document_id = request.match_info['document_id']
+    try:
+        await run_blocking(DB.delete_document, collection_name, document_id)
+        await run_blocking(refresh_study, collection_name, document_id)
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=400)
+    return web.json_response({'message': f'Document {document_id} deleted successfully.'})
+
+@limited("documents")
+async def query_documents(request):
+    field = request.query.get('field')
+    operation = request.query.get('operation', '==')
+    value = request.query.get('value')
+    if not (field and value):
+        return web.json_response({'error': 'Field and value query parameters are required.'}, status=400)
+    results = await run_blocking(DB.query_documents, request.match_info['collection_name'], field, operation, value)
+    return web.json_response(results)
+
+@limited("documents")
+async def aggregate_documents(request):
+    if 'column' not in request.query:
+        return web.json_response({'error': 'The column query parameter is required.'}, status=400)
+    try:
+        kwargs = aggregate_args(request.query)
+        result = await run_blocking(lambda: AGGREGATES.aggregate(request.match_info['collection_name'], request.match_info['document_id'], **kwargs))
+    except KeyError as e:
+        return web.json_response({'error': e.args[0]}, status=404)
+    except ValueError as e:
+        return web.json_response({'error': str(e)}, status=400)
+    return web.json_response(result)
+
+async def summary_response(request):
+
+    body, compressed, etag = await run_blocking(SUMMARIES.blob)
+
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        headers['Content-Encoding'] = 'gzip'
+        body = compressed
+        etag += '-gzip'
+
+    headers['ETag'] = f'"{etag}"'
+
+    if headers['ETag'] in request.headers.get('If-None-Match', ''):
+        return web.Response(status=304, headers=headers)
+
+    return web.Response(body=body, content_type='application/json', headers=headers)
+
+async def stream_rows(request, collection_name, fields, after, output):
+
+    """
+    Stream a whole collection as a JSON array or NDJSON without holding it in memory.
+    """
+
+    documents = DB.stream_documents(collection_name, fields, after=after)
+
+    try:
+        first = await run_blocking(next, documents, None)
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
+
+    ndjson = output == 'ndjson'
+    response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson' if ndjson else 'application/json'})
+    await response.prepare(request)
+
+    if not ndjson:
+        await response.write(b"[")
+
+    async def write_row(index, document_id, document):
+        row = json.dumps(summary_row(document_id, document, fields))
+        if ndjson:
+            await response.write(f"{row}\n".encode('utf-8'))
+        else:
+            await response.write(f"{',' if index else ''}{row}".encode('utf-8'))
+
+    if first is not None:
+
+        await write_row(0, *first)
+
+        index = 1
+        async for document_id, document in iterate_blocking(documents):
+            await write_row(index, document_id, document)
+            index += 1
+
+    if not ndjson:
+        await response.write(b"]")
+
+    await response.write_eof()
+
+    return response
+
+@limited("documents")
+async def get_all_documents(request):
+
+    """
+    Same contract as server.get_all_documents.
+    """
+
+    collection_name = request.match_info['collection_name']
+
+    if collection_name == "Project" and not request.query:
+        return await summary_response(request)
+
+    fields = request.query.get('fields')
+    fields = fields.split(',') if fields else SUMMARY_FIELDS
+    output = request.query.get('format', 'json')
+    after = request.query.get('after')
+    limit = request.query.get('limit')
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE)) if limit else None
+
+    if limit is None:
+        return await stream_rows(request, collection_name, fields, after, output)
+
+    def read_page():
+        return list(DB.stream_documents(collection_name, fields, limit=limit, after=after))
+
+    try:
+        page = await run_blocking(read_page)
+    except Exception as e:
+        return web.json_response({'error': str(e)}, status=500)
+
+    rows = [summary_row(document_id, document, fields) for document_id, document in page]
+    next_cursor = page[-1][0] if len(page) == limit else None
+
+    if output == 'ndjson':
+        headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+        return web.Response(text="".join(json.dumps(row) + "\n" for row in rows), content_type='application/x-ndjson', headers=headers)
+
+    return web.json_response({'data': rows, 'next': next_cursor})
+
+async def sse_response(request, tokens):
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+    await response.prepare(request)
+
+    try:
+        async for token in tokens:
+            await response.write(f"data: {json.dumps({'token': token})}\n\n".encode('utf-8'))
+        await response.write(b"event: done\ndata: {}\n\n")
+    except Exception as e:
+        print(f"Error: {e}")
+        await response.write(f"event: error\ndata: {json.dumps({'error': CHAT_ERROR})}\n\n".encode('utf-8'))
+
+    await response.write_eof()
+
+    return response
+
+@limited("chatbot")
+async def chatbot_api(request):
+    data = await request.json()
+    if not data or 'message' not in data:
+        return web.json_response({'error': 'No message provided'}, status=400)
+    try:
+        bot_response = await chatbot_async(data['message'])
+    except Exception as e:
+        print(f"Error: {e}")
+        return web.json_response({'error': CHAT_ERROR}, status=500)
+    return web.json_response({'response': bot_response})
+
+@limited("chatbot")
+async def chatbot_stream_api(request):
+    data = await request.json()
+    if not data or 'message' not in data:
+        return web.json_response({'error': 'No message provided'}, status=400)
+    return await sse_response(request, chatbot_stream_async(data['message']))
+
+@limited("chatbot")
+async def chatbot_project_api(request):
+    data = await request.json()
+    table_text = format_table(data["data"], data["percent"])
+    try:
+        bot_response = await chatbot_specific_async(data["query"], table_text, data["accession"])
+    except Exception as e:
+        print(f"Error: {e}")
+        return web.json_response({'error': CHAT_ERROR}, status=500)
+    return web.json_response({'response': bot_response})
+
+@limited("chatbot")
+async def chatbot_project_stream_api(request):
+    data = await request.json()
+    table_text = format_table(data["data"], data["percent"])
+    return await sse_response(request, chatbot_specific_stream_async(data["query"], table_text, data["accession"]))
+
+async def chatbot_stats_api(request):
+    return web.json_response(cache_stats())
+
+async def metrics_api(request):
+    return web.Response(text=METRICS.render(), content_type='text/plain')
+
+def create_app() -> web.Application:
+
+    app = web.Application(middlewares=[metrics_middleware, cors_middleware])
+    app[ROUTE_LIMITS] = {group: asyncio.Semaphore(limit) for group, limit in ROUTE_CONCURRENCY.items()}
+
+    app.router.add_post('/api/chatbot', chatbot_api)
+    app.router.add_post('/api/chatbot/stream', chatbot_stream_api)
+    app.router.add_post('/api/chatbot/project', chatbot_project_api)
+    app.router.add_post('/api/chatbot/project/stream', chatbot_project_stream_api)
+    app.router.add_get('/api/chatbot/stats', chatbot_stats_api)
+    app.router.add_get('/api/metrics', metrics_api)
+
+    app.router.add_post('/api/{collection_name}', add_document)
+    app.router.add_get('/api/{collection_name}/all', get_all_documents)
+    app.router.add_get('/api/{collection_name}/query', query_documents)
+    app.router.add_get('/api/{collection_name}/{document_id}/aggregate', aggregate_documents)
+    app.router.add_get('/api/{collection_name}/{document_id}', get_document)
+    app.router.add_put('/api/{collection_name}/{document_id}', update_document)
+    app.router.add_delete('/api/{collection_name}/{document_id}', delete_document)
+
+    return app
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Serve the API with aiohttp.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    args = parser.parse_args()
+
+    initialize()
+    web.run_app(create_app(), host=args.host, port=args.port)
@@ -0,0 +1,219 @@
+"""
+Offline benchmark of the ingestion and retrieval pipeline.
+
+    python bench_pipeline.py --samples 100 1000 10000 --protocols 20 --contacts 10 --output results.json
+
+Nothing leaves the machine. OSDR, Firestore, the vector store and the Groq
+LLM are replaced by the fakes in fakes.py, a LocalVectorStore in a temporary
+directory, and the fake_llm.py server. Embeddings come from
+fakes.HashingModel. With --real-embeddings the SentenceTransformer is used
+instead, loaded from the local Hugging Face cache only.
+
+Measured:
+
+    get_sample_data / get_assay_data   encoding the tables of one study
+    create_document                    building and writing one study's documents
+    add                                fetch + create_document + chunk, embed and upsert
+    embedding                          chunk texts per second through EMBEDDINGS.encode
+    chatbot / chatbot_specific         end to end with cleared caches (cold) and with the answer cached (warm)
+
+Each measurement reports the best and median of --repeat runs. Results go to
+--output as JSON, together with the settings they were measured with, so
+runs before and after a change can be compared.
+"""
+
+from fakes import FakeFirestore, FakeOSDRAdapter, HashingModel, synthetic_study
+import fake_llm
+
+from collections import Counter
+import contextlib
+import statistics
+import threading
+import argparse
+import platform
+import tempfile
+import time
+import json
+import io
+import os
+
+QUESTION = "How does microgravity change bone density in mice?"
+
+def measure(function, repeat: int) -> dict:
+
+    seconds = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+
+    return {"best": min(seconds), "median": statistics.median(seconds), "runs": repeat}
+
+def configure(directory: str, llm_port: int, real_embeddings: bool):
+
+    """
+    Point every external dependency at its local fake. Must run before any
+    pipeline module is imported, since constants.py reads the environment once.
+    """
+
+    os.environ.update({
+        "GROQ_API_KEY": "offline",
+        "GROQ_BASE_URL": f"http://127.0.0.1:{llm_port}",
+        "PINECONE_API_KEY": "offline",
+        "VECTOR_STORE": "local",
+        "LOCAL_INDEX_PATH": os.path.join(directory, "vector_index"),
+        "OSDR_CACHE_DIR": os.path.join(directory, "osdr_cache"),
+        # Revalidate on every fetch, so `add` always goes through the OSDR fake
+        "OSDR_CACHE_MAX_AGE": "0",
+        "OSDR_OFFLINE": "0",
+        "QUERY_CACHE_PATH": "",
+    })
+
+    if real_embeddings:
+        os.environ["HF_HUB_OFFLINE"] = "1"
+
+def run(args) -> dict:
+
+    import parse
+    import chatbot
+    from embeddings import EMBEDDINGS
+    from constants import EMBEDDING_DIM
+    from chunks import split_document
+    from service import format_table
+    from resources import RESOURCES
+
+    if not args.real_embeddings:
+        RESOURCES.set("embedding_model", HashingModel(EMBEDDING_DIM))
+
+    studies = {
+        f"OSD-B{samples}": synthetic_study(f"OSD-B{samples}", samples, args.protocols, args.contacts)
+        for samples in args.samples
+    }
+    studies.update({
+        f"OSD-C{i}": synthetic_study(f"OSD-C{i}", args.corpus_samples, args.protocols, args.contacts, seed=i)
+        for i in range(args.studies)
+    })
+
+    osdr = FakeOSDRAdapter(studies, args.osdr_latency)
+    parse.SESSION.mount("https://osdr.nasa.gov/", osdr)
+
+    results = {"tables": [], "embedding": None, "chatbot": None}
+
+    for samples in args.samples:
+
+        accession = f"OSD-B{samples}"
+        study = studies[accession]
+
+        results["tables"].append({
+            "samples": samples,
+            "get_sample_data_seconds": measure(lambda: parse.get_sample_data(study, accession, {}), args.repeat),
+            "get_assay_data_seconds": measure(lambda: parse.get_assay_data(study, accession, {}), args.repeat),
+            "create_document_seconds": measure(lambda: parse.create_document(study), args.repeat),
+            "add_seconds": measure(lambda: parse.add(accession), args.repeat),
+        })
+
+    # The retrieval corpus: every study embedded and indexed once
+    corpus = [accession for accession in studies if accession.startswith("OSD-C")]
+    documents = [parse.create_document(studies[accession]) for accession in corpus]
+    texts = [embedding_text for metadata, page_content in documents for _, _, _, embedding_text in split_document(metadata, page_content)]
+
+    embed_seconds = measure(lambda: EMBEDDINGS.encode(texts), args.repeat)
+
+    results["embedding"] = {
+        "model": "sentence-transformers" if args.real_embeddings else "hashing",
+        "texts": len(texts),
+        "seconds": embed_seconds,
+        "texts_per_second": len(texts) / embed_seconds["best"],
+    }
+
+    parse.upsert_documents(documents)
+
+    def cold(function, *inputs):
+
+        def ask():
+            chatbot.ANSWER_CACHE.clear()
+            chatbot.QUERY_CACHE.clear()
+            function(QUESTION, *inputs)
+
+        return measure(ask, args.repeat)
+
+    def warm(function, *inputs):
+
+        function(QUESTION, *inputs)
+
+        return measure(lambda: function(QUESTION, *inputs), args.repeat)
+
+    # The data visual the frontend sends with a study-specific question
+    factors = Counter(row["Factor Value[Spaceflight]"] for row in studies[corpus[0]]["samples"]["table"])
+    table = format_table([{"name": name, "value": count} for name, count in factors.most_common()], False)
+
+    results["chatbot"] = {
+        "studies": len(corpus),
+        "llm_delay": args.llm_delay,
+        "chatbot_cold_seconds": cold(chatbot.chatbot),
+        "chatbot_warm_seconds": warm(chatbot.chatbot),
+        "chatbot_specific_cold_seconds": cold(chatbot.chatbot_specific, table, corpus[0]),
+        "chatbot_specific_warm_seconds": warm(chatbot.chatbot_specific, table, corpus[0]),
+    }
+
+    results["fakes"] = {"osdr_requests": osdr.requests, "firestore_round_trips": parse.DB.client().round_trips}
+
+    return results
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark ingestion and retrieval offline.")
+    parser.add_argument("--samples", type=int, nargs="+", default=[100, 1000, 10000], help="Sample counts of the studies timed through ingestion")
+    parser.add_argument("--protocols", type=int, default=20, help="Protocols per study")
+    parser.add_argument("--contacts", type=int, default=10, help="Contacts per study")
+    parser.add_argument("--studies", type=int, default=20, help="Studies indexed for the embedding and chatbot measurements")
+    parser.add_argument("--corpus-samples", type=int, default=100, help="Sample count of each indexed study")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement")
+    parser.add_argument("--llm-delay", type=float, default=0.0, help="Seconds per token of the fake LLM")
+    parser.add_argument("--firestore-latency", type=float, default=0.0, help="Seconds per fake Firestore round trip")
+    parser.add_argument("--osdr-latency", type=float, default=0.0, help="Seconds per fake OSDR request")
+    parser.add_argument("--real-embeddings", action="store_true", help="Use the SentenceTransformer from the local cache instead of HashingModel")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    llm = fake_llm.serve(0, args.llm_delay)
+    threading.Thread(target=llm.serve_forever, daemon=True).start()
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        configure(directory, llm.server_address[1], args.real_embeddings)
+        FakeFirestore(args.firestore_latency).install()
+
+        # The pipeline reports progress with print; keep it out of the results
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = run(args)
+
+    llm.shutdown()
+
+    report = {
+        "settings": vars(args),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    for table in results["tables"]:
+        print(
+            f"{table['samples']:>7} samples: get_sample_data {table['get_sample_data_seconds']['median'] * 1000:8.2f} ms, "
+            f"get_assay_data {table['get_assay_data_seconds']['median'] * 1000:8.2f} ms, "
+            f"create_document {table['create_document_seconds']['median'] * 1000:8.2f} ms, "
+            f"add {table['add_seconds']['median'] * 1000:8.2f} ms"
+        )
+
+    print(f"embedding: {results['embedding']['texts_per_second']:.0f} texts/s ({results['embedding']['model']}, {results['embedding']['texts']} texts)")
+
+    for name in ("chatbot", "chatbot_specific"):
+        print(
+            f"{name}: cold {results['chatbot'][f'{name}_cold_seconds']['median'] * 1000:.1f} ms, "
+            f"warm {results['chatbot'][f'{name}_warm_seconds']['median'] * 1000:.1f} ms"
+        )
@@ -0,0 +1,195 @@
+"""
+Benchmark the study document renderer against the previous template + minidom path.
+
+    python bench_render.py --protocols 10 100 1000 --contacts 50 --repeat 5
+
+Both renderers get the same synthetic Project document. The previous path is
+reproduced here as it was: `+=` string building, BASE_DOCUMENT.format and a
+minidom parse/pretty-print. The synthetic text has no `&` or `<`, because the
+old path cannot parse those.
+"""
+
+from render import render_document
+from chunks import split_document
+from fakes import sentence
+
+import xml.dom.minidom
+import argparse
+import random
+import time
+import json
+
+LEGACY_DOCUMENT = """
+<CONTENT>
+    <ACCESSION>
+        {accession}
+    </ACCESSION>
+    <DESCRIPTION>
+        {description}
+    </DESCRIPTION>
+    <FACTORS>
+        {factors}
+    </FACTORS>
+    <ORGANISM>
+        {organism}
+    </ORGANISM>
+    <PROJECT>
+        {project}
+    </PROJECT>
+    <COLLABORATORS>
+        {collaborators}
+    </COLLABORATORS>
+    <PAYLOAD>
+        {payload}
+    </PAYLOAD>
+    <MISSIONS>
+        {mission}
+    </MISSIONS>
+    <PROTOCOLS>
+        {protocols}
+    </PROTOCOLS>
+</CONTENT>
+"""
+
+def synthetic_project(accession: str, protocols: int, contacts: int, seed: int = 0) -> dict:
+
+    """
+    A Project document shaped like the ones `parse.create_document` builds.
+    """
+
+    rng = random.Random(seed)
+
+    return {
+        "accession": accession,
+        "title": sentence(rng, 8),
+        "description": " ".join(sentence(rng, 20) for _ in range(10)),
+        "factors": ["Spaceflight", "Ionizing Radiation"],
+        "organism": "Mus musculus",
+        "project": {"Project Title": sentence(rng, 6), "Project Type": "Flight", "Flight Program": "ISS"},
+        "collaborators": [
+            {"firstName": f"First{i}", "lastName": f"Last{i}", "email": f"user{i}@example.org", "affiliation": sentence(rng, 4), "role": "Investigator"}
+            for i in range(contacts)
+        ],
+        "payload": {"identifier": "RR-1", "name": sentence(rng, 3), "description": sentence(rng, 30)},
+        "mission": {"name": "SpaceX-4", "start": "09/21/2014", "end": "10/25/2014"},
+        "protocols": [{"name": f"Protocol {i}", "description": " ".join(sentence(rng, 25) for _ in range(6))} for i in range(protocols)],
+    }
+
+def legacy_render(document: dict) -> str:
+
+    text = ""
+    for factor in document["factors"]:
+        text += f"{factor}\n"
+    factors = text.split()
+
+    text = ""
+    for key, value in document["project"].items():
+        text += f"{key}: {value}\n"
+    project = text.split()
+
+    collaborators = ""
+    for collaborator in document["collaborators"]:
+        collaborators += f"""
+<Name>
+    {collaborator["firstName"]} {collaborator["lastName"]}
+</Name>
+<Email>
+    {collaborator["email"]}
+</Email>
+<Affiliation>
+    {collaborator["affiliation"]}
+</Affiliation>
+<Role>
+    {collaborator["role"]}
+</Role>
+"""
+
+    text = ""
+    for key, value in document["payload"].items():
+        text += f"{key}: {value}\n"
+    payload = text.split()
+
+    text = ""
+    for key, value in document["mission"].items():
+        text += f"{key}: {value}\n"
+    mission = text.split()
+
+    protocols = ""
+    for protocol in document["protocols"]:
+        protocols += f"""
+<Protocol>
+    <Name>{protocol["name"]}</Name>
+    <Description>{protocol["description"]}</Description>
+</Protocol>
+"""
+
+    rendered = LEGACY_DOCUMENT.format(
+        accession=document["accession"],
+        description=document["description"],
+        factors=factors,
+        organism=document["organism"],
+        project=project,
+        collaborators=collaborators.strip(),
+        payload=payload,
+        mission=mission,
+        protocols=protocols.strip(),
+    )
+
+    return xml.dom.minidom.parseString(rendered).toprettyxml(indent="\t")
+
+def timed(function, repeat: int) -> float:
+
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+def run(protocol_counts: list, contacts: int, repeat: int) -> list:
+
+    results = []
+
+    for protocols in protocol_counts:
+
+        document = synthetic_project("OSD-0", protocols, contacts)
+        metadata = {"accession": "OSD-0", "project_title": document["title"]}
+
+        legacy_document = legacy_render(document)
+
+        results.append({
+            "protocols": protocols,
+            "contacts": contacts,
+            "legacy_seconds": timed(lambda: legacy_render(document), repeat),
+            "render_seconds": timed(lambda: render_document(document), repeat),
+            # Chunking a legacy-style string has to parse the XML; rendered documents carry their records
+            "legacy_chunk_seconds": timed(lambda: split_document(metadata, legacy_document), repeat),
+            "render_chunk_seconds": timed(lambda: split_document(metadata, render_document(document)), repeat),
+            "legacy_bytes": len(legacy_document),
+            "render_bytes": len(render_document(document)),
+        })
+
+    return results
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark study document rendering.")
+    parser.add_argument("--protocols", type=int, nargs="+", default=[10, 100, 1000], help="Protocol counts to try")
+    parser.add_argument("--contacts", type=int, default=50, help="Contacts per study")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement; the best is reported")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.protocols, args.contacts, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print(
+                f"{result['protocols']:>6} protocols: legacy {result['legacy_seconds'] * 1000:8.2f} ms, "
+                f"render {result['render_seconds'] * 1000:7.2f} ms ({result['legacy_seconds'] / result['render_seconds']:.1f}x); "
+                f"render+chunk {result['render_chunk_seconds'] * 1000:7.2f} ms vs parse+chunk {result['legacy_chunk_seconds'] * 1000:7.2f} ms"
+            )
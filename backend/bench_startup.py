@@ -0,0 +1,201 @@
+"""
+Benchmark cold start: import times, and how soon a server answers its first request.
+
+    python bench_startup.py --repeat 5 --output startup.json
+
+Every measurement runs in a fresh interpreter. `import` runs time importing
+each of --modules. `serve` runs time server.py (Flask) and async_server.py
+(aiohttp) until they listen on a port and until they answer
+GET /api/Project/<id>. Firestore is a fakes.FakeFirestore holding one
+Project document, so no credentials are needed. Each run also lists which
+heavy libraries (torch, sentence_transformers, groq, ...) had been imported
+by then; none should be there before the first chat request.
+
+WARM_RESOURCES is empty in the child processes unless --warm is given, so
+the numbers are those of a purely lazy start. Import runs also disable the
+document cache, whose warm-up would otherwise connect to Firestore.
+"""
+
+import subprocess
+import statistics
+import argparse
+import platform
+import json
+import time
+import sys
+import os
+
+HEAVY_MODULES = ["torch", "transformers", "sentence_transformers", "langchain", "groq", "pinecone", "firebase_admin", "pandas"]
+
+ACCESSION = "OSD-0"
+
+def heavy_modules() -> list:
+    return [name for name in HEAVY_MODULES if name in sys.modules]
+
+def child_import(module: str) -> dict:
+
+    start = time.perf_counter()
+    __import__(module)
+
+    return {"import_seconds": time.perf_counter() - start, "heavy_modules": heavy_modules()}
+
+def child_serve(server: str) -> dict:
+
+    import urllib.request
+    import threading
+
+    from fakes import FakeFirestore
+
+    FakeFirestore().install().write("Project", ACCESSION, {"accession": ACCESSION, "title": "Startup benchmark"})
+
+    start = time.perf_counter()
+
+    if server == "server":
+
+        from werkzeug.serving import make_server
+        import server as module
+
+        imported = time.perf_counter()
+        http = make_server("127.0.0.1", 0, module.app, threaded=True)
+        port = http.server_port
+        threading.Thread(target=http.serve_forever, daemon=True).start()
+
+    else:
+
+        from aiohttp import web
+        import asyncio
+        import async_server as module
+
+        imported = time.perf_counter()
+        ready = threading.Event()
+        port = None
+
+        def serve():
+
+            nonlocal port
+
+            async def run():
+
+                nonlocal port
+
+                runner = web.AppRunner(module.create_app())
+                await runner.setup()
+                site = web.TCPSite(runner, "127.0.0.1", 0)
+                await site.start()
+                port = runner.addresses[0][1]
+                ready.set()
+
+                await asyncio.Event().wait()
+
+            asyncio.run(run())
+
+        module.initialize()
+        threading.Thread(target=serve, daemon=True).start()
+        ready.wait()
+
+    listening = time.perf_counter()
+
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/Project/{ACCESSION}") as response:
+        status = response.status
+        response.read()
+
+    answered = time.perf_counter()
+
+    return {
+        "import_seconds": imported - start,
+        "listen_seconds": listening - start,
+        "first_response_seconds": answered - start,
+        "status": status,
+        "heavy_modules": heavy_modules(),
+    }
+
+def spawn(arguments: list, environment: dict) -> dict:
+
+    """
+    Run this script as a child with `arguments`; returns its JSON result plus
+    the wall-clock time from spawning the process to its result.
+    """
+
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), *arguments], env=environment, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+
+    if completed.returncode != 0:
+        raise RuntimeError(f"{' '.join(arguments)} failed:\n{completed.stderr}")
+
+    result = json.loads(completed.stdout)
+    result["process_seconds"] = seconds
+
+    return result
+
+def summarize(runs: list) -> dict:
+
+    summary = {
+        key: {"best": min(run[key] for run in runs), "median": statistics.median(run[key] for run in runs)}
+        for key in runs[0] if key.endswith("_seconds")
+    }
+    summary["heavy_modules"] = runs[-1]["heavy_modules"]
+
+    if "status" in runs[-1]:
+        summary["status"] = runs[-1]["status"]
+
+    return summary
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmark import and server start-up times.")
+    parser.add_argument("--modules", nargs="+", default=["constants", "db", "parse", "chatbot", "service", "server", "async_server"], help="Modules whose import is timed")
+    parser.add_argument("--servers", nargs="+", default=["server", "async_server"], choices=["server", "async_server"], help="Servers timed to their first response")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--warm", help="WARM_RESOURCES for the children, e.g. firestore,embedding_model")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "TARGET"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+
+        # The pipeline reports progress with print, also from the warm-up thread; keep stdout for the result
+        output, sys.stdout = sys.stdout, sys.stderr
+
+        mode, target = args.child
+        result = child_import(target) if mode == "import" else child_serve(target)
+
+        output.write(json.dumps(result))
+        output.flush()
+        sys.exit(0)
+
+    environment = {
+        **os.environ,
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "offline"),
+        "WARM_RESOURCES": args.warm or "",
+        "VECTOR_STORE": os.environ.get("VECTOR_STORE", "local"),
+    }
+
+    # Import runs have no fake Firestore installed
+    imports = {**environment, "DB_CACHE": "0"}
+
+    results = {
+        "imports": {module: summarize([spawn(["--child", "import", module], imports) for _ in range(args.repeat)]) for module in args.modules},
+        "servers": {server: summarize([spawn(["--child", "serve", server], environment) for _ in range(args.repeat)]) for server in args.servers},
+    }
+
+    report = {
+        "settings": vars(args),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    for module, result in results["imports"].items():
+        print(f"import {module:<14} {result['import_seconds']['median'] * 1000:8.1f} ms  heavy: {', '.join(result['heavy_modules']) or '-'}")
+
+    for server, result in results["servers"].items():
+        print(
+            f"{server:<14} listening {result['listen_seconds']['median'] * 1000:7.1f} ms, "
+            f"first response {result['first_response_seconds']['median'] * 1000:7.1f} ms "
+            f"({result['process_seconds']['median'] * 1000:.0f} ms from spawn), heavy: {', '.join(result['heavy_modules']) or '-'}"
+        )
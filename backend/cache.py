@@ -0,0 +1,243 @@
+from collections import OrderedDict
+import threading
+import pickle
+import atexit
+import time
+import os
+import re
+
+class LRUCache:
+
+    """
+    Thread-safe, size-bounded LRU with optional TTL and on-disk persistence.
+
+    Expiry times are wall-clock so that entries loaded from `path` after a
+    restart keep their original deadline. Persisted snapshots are written
+    atomically at most every `persist_interval` seconds and at exit.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = None, path: str = None, persist_interval: float = 30.0):
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.persist_interval = persist_interval
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._last_save = time.monotonic()
+
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    def get(self, key, default=None):
+
+        with self._lock:
+
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self._dirty = True
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def set(self, key, value, ttl: float = None):
+
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+
+        with self._lock:
+
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+            self._dirty = True
+            self._maybe_save()
+
+    def invalidate(self, key) -> bool:
+
+        with self._lock:
+
+            removed = self._entries.pop(key, None) is not None
+            self._dirty = self._dirty or removed
+
+            return removed
+
+    def invalidate_where(self, predicate) -> int:
+
+        """
+        Drop every entry whose key satisfies `predicate`; returns how many were removed.
+        """
+
+        with self._lock:
+
+            keys = [key for key in self._entries if predicate(key)]
+
+            for key in keys:
+                del self._entries[key]
+
+            self._dirty = self._dirty or bool(keys)
+
+            return len(keys)
+
+    def invalidate_values(self, predicate) -> int:
+
+        """
+        Drop every entry whose value satisfies `predicate`; returns how many were removed.
+        """
+
+        with self._lock:
+
+            keys = [key for key, (value, _) in self._entries.items() if predicate(value)]
+
+            for key in keys:
+                del self._entries[key]
+
+            self._dirty = self._dirty or bool(keys)
+
+            return len(keys)
+
+    def clear(self):
+
+        with self._lock:
+
+            self._entries.clear()
+            self._dirty = True
+
+    def stats(self) -> dict:
+
+        with self._lock:
+
+            lookups = self.hits + self.misses
+
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def load(self):
+
+        if not self.path or not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, "rb") as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable cache file {self.path}: {e}")
+            return
+
+        now = time.time()
+
+        with self._lock:
+
+            for key, (value, expires_at) in entries.items():
+
+                if expires_at is None or expires_at > now:
+                    self._entries[key] = (value, expires_at)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def save(self):
+
+        if not self.path:
+            return
+
+        with self._lock:
+
+            if not self._dirty:
+                return
+
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(dict(self._entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+
+            self._dirty = False
+            self._last_save = time.monotonic()
+
+    def _maybe_save(self):
+
+        if self.path and time.monotonic() - self._last_save >= self.persist_interval:
+            self.save()
+
+    def __len__(self):
+        return len(self._entries)
+
+def normalize_query(query: str) -> str:
+
+    """
+    Case- and whitespace-insensitive form of a chat query, used as a cache key.
+    """
+
+    return re.sub(r"\s+", " ", query).strip().casefold()
+
+class QueryCache:
+
+    """
+    Caches the embedding and top-k matches of a chat query, keyed by its normalized text.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = None, path: str = None):
+
+        self._cache = LRUCache(max_size=max_size, ttl=ttl, path=path)
+
+    def get(self, query: str, top_k: int):
+
+        """
+        Return `(embedding, matches)` for a previously seen query, or None.
+        """
+
+        return self._cache.get((normalize_query(query), top_k))
+
+    def put(self, query: str, top_k: int, embedding, matches: list):
+
+        self._cache.set((normalize_query(query), top_k), (embedding, matches))
+
+    def invalidate_accession(self, accession: str) -> int:
+
+        """
+        Drop the queries whose matches include a chunk of `accession`, e.g. after it is re-ingested.
+        """
+
+        return self._cache.invalidate_values(lambda entry: any(match["metadata"].get("accession") == accession for match in entry[1]))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> dict:
+        return self._cache.stats()
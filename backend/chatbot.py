@@ -1,34 +1,40 @@
-from constants import GROQ_API_KEY, PINECONE_API_KEY, INDEX_NAME
-
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
-from groq import Groq
-
-pc = Pinecone(api_key=PINECONE_API_KEY)
-groq = Groq(api_key=GROQ_API_KEY)
-
-def get_huggingface_embeddings(text, model_name="sentence-transformers/all-MiniLM-L6-v2"):
-    model = SentenceTransformer(model_name)
-    return model.encode(text)
-
-def chatbot(query):
+from constants import LLM_MODEL, PROMPT_TOKEN_BUDGET, CHUNK_MAX_TOKENS, RETRIEVAL_CANDIDATES, QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_PATH
+from embeddings import EMBEDDINGS
+from cache import QueryCache
+from vectorstore import get_vector_store
+from context_store import CONTEXTS
+from chunks import assemble, estimate_tokens
+from semantic_cache import ANSWER_CACHE, hash_context
+from clients import get_groq, get_async_groq, IO_EXECUTOR
+from metrics import METRICS
+
+import contextvars
+import asyncio
+
+QUERY_CACHE = QueryCache(max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL, path=QUERY_CACHE_PATH)
+
+SYSTEM_PROMPT = """
+    You are a science expert. More specifically, your concentration includes science experiments on space. 
 
-    pinecone = Pinecone(api_key=PINECONE_API_KEY)
-    pc_index = pinecone.Index(INDEX_NAME)
+    I am a scientists myself as well. However, I don't have expertise in experiments run on an outer space setting. 
 
-    raw_query_embedding = get_huggingface_embeddings(query)
+    Always consider all of the context provided when forming your response. 
+    
+    Limit your response to 250 words.
 
-    top_matches = pc_index.query(vector=raw_query_embedding.tolist(), top_k=3, include_metadata=True)
-    contexts = [item['metadata']['text'] for item in top_matches['matches']]
+    When responding format your response in bullet points (use newlines if needed).
 
-    augmented_query = "\n" + "\n\n-------\n\n".join(contexts[:10]) + "\n-------\n\n\n\n\nMY QUESTION:\n" + query
+    I want you to answer as if you were having a CONVERSATION with me, a scientist. 
+    
+    Also refrain from saying given the information provided or any such expression.  
+    """
 
-    system_prompt = f"""
+SPECIFIC_SYSTEM_PROMPT = """
     You are a science expert. More specifically, your concentration includes science experiments on space. 
 
     I am a scientists myself as well. However, I don't have expertise in experiments run on an outer space setting. 
 
-    Always consider all of the context provided when forming your response. 
+    Always consider all of the context and table provided when forming your response.
     
     Limit your response to 250 words.
 
@@ -39,72 +45,299 @@ def chatbot(query):
     Also refrain from saying given the information provided or any such expression.  
     """
 
-    groq_client = Groq(api_key=GROQ_API_KEY)
+# Context of a study with nothing in the vector store (e.g. its vectors were pruned or never written)
+NO_CONTEXT = "No description of this study is indexed. Answer from the table below only, and say that the study's text is unavailable.\n\n"
+
+def get_huggingface_embeddings(text):
+    return EMBEDDINGS.encode(text)
+
+def retrieve(query, top_k=RETRIEVAL_CANDIDATES):
+
+    """
+    Return the query's embedding and its top matches in the vector store.
+    """
+
+    cached = QUERY_CACHE.get(query, top_k)
+
+    if cached is not None:
+        return cached
+
+    raw_query_embedding = get_huggingface_embeddings(query)
+
+    matches = get_vector_store().query(raw_query_embedding, top_k=top_k)
+
+    QUERY_CACHE.put(query, top_k, raw_query_embedding, matches)
+
+    return raw_query_embedding, matches
+
+async def retrieve_async(query, top_k=RETRIEVAL_CANDIDATES):
+
+    """
+    `retrieve` for the async server: the embedding is queued on the
+    embedding service's batching thread and the vector query runs on the I/O executor.
+    """
+
+    cached = QUERY_CACHE.get(query, top_k)
+
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+
+    with METRICS.span("embedding.wait"):
+        raw_query_embedding = await asyncio.wrap_future(EMBEDDINGS.submit(query))
+
+    # Run in a copy of this context so the query's span joins the request's trace
+    context = contextvars.copy_context()
+    matches = await loop.run_in_executor(IO_EXECUTOR, context.run, lambda: get_vector_store().query(raw_query_embedding, top_k=top_k))
+
+    QUERY_CACHE.put(query, top_k, raw_query_embedding, matches)
+
+    return raw_query_embedding, matches
+
+def get_top_matches(query, top_k=RETRIEVAL_CANDIDATES):
+    return retrieve(query, top_k)[1]
+
+async def get_top_matches_async(query, top_k=RETRIEVAL_CANDIDATES):
+    return (await retrieve_async(query, top_k))[1]
+
+def match_accessions(top_matches):
+    return [item['metadata'].get('accession') for item in top_matches if item['metadata'].get('accession')]
+
+def build_messages(query, top_matches):
+
+    contexts = assemble(top_matches, PROMPT_TOKEN_BUDGET)
+
+    augmented_query = "\n" + "\n\n-------\n\n".join(contexts) + "\n-------\n\n\n\n\nMY QUESTION:\n" + query
+
+    METRICS.count("prompt_tokens_total", estimate_tokens(augmented_query), prompt="general")
+
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": augmented_query}
+    ]
+
+def get_messages(query):
+    return build_messages(query, get_top_matches(query))
+
+async def get_messages_async(query):
+    return build_messages(query, await get_top_matches_async(query))
+
+def get_specific_messages(query, table, accession, embedding=None):
+
+    """
+    Prompt for a question about one study: the study's section chunks closest to
+    the question, as many as fit next to `table` in PROMPT_TOKEN_BUDGET.
+    """
+
+    if embedding is None:
+        embedding = get_huggingface_embeddings(query)
+
+    matches = get_vector_store().query(embedding, top_k=RETRIEVAL_CANDIDATES, filter={"accession": accession})
+    chunks = [match for match in matches if "section" in match['metadata']]
+
+    if chunks:
+
+        budget = max(PROMPT_TOKEN_BUDGET - estimate_tokens(table), CHUNK_MAX_TOKENS)
+        contexts = "\n\n".join(assemble(chunks, budget))
+
+    else:
+
+        # Studies indexed before section chunks have a single vector holding the whole document
+        contexts = CONTEXTS.get(accession)
+
+        if contexts is None:
+            contexts = matches[0]['metadata']['text'] if matches else NO_CONTEXT
+
+    augmented_query = contexts + table + "\n\n\n\nMY QUESTION:\n" + query
+
+    METRICS.count("prompt_tokens_total", estimate_tokens(augmented_query), prompt="specific")
+
+    return [
+        {"role": "system", "content": SPECIFIC_SYSTEM_PROMPT},
+        {"role": "user", "content": augmented_query}
+    ]
 
-    llm_response = groq_client.chat.completions.create(
-        model="llama-3.1-70b-versatile",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": augmented_query}
-        ]
+async def get_specific_messages_async(query, table, accession, embedding=None):
+
+    loop = asyncio.get_running_loop()
+
+    if embedding is None:
+        with METRICS.span("embedding.wait"):
+            embedding = await asyncio.wrap_future(EMBEDDINGS.submit(query))
+
+    context = contextvars.copy_context()
+
+    return await loop.run_in_executor(IO_EXECUTOR, context.run, get_specific_messages, query, table, accession, embedding)
+
+@METRICS.timed("llm.complete")
+def complete(messages):
+
+    llm_response = get_groq().chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages
     )
 
     response = llm_response.choices[0].message.content
     
     return response
 
-def chatbot_specific(query, table, accession):
+@METRICS.timed("llm.stream")
+def complete_stream(messages):
 
-    pinecone = Pinecone(api_key=PINECONE_API_KEY)
-    pc_index = pinecone.Index(INDEX_NAME)
+    """
+    Yield the completion's text as the LLM produces it.
+    """
 
-    embedding_dim = 384  # Replace with the actual dimension of your index
-    dummy_vector = [0] * embedding_dim
+    stream = get_groq().chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        stream=True
+    )
+
+    for chunk in stream:
+
+        token = chunk.choices[0].delta.content if chunk.choices else None
+
+        if token:
+            yield token
 
-    metadata_filter = {
-        "accession": accession
-    }
+@METRICS.timed("llm.complete")
+async def complete_async(messages):
 
-    # Perform the query with the metadata filter
-    response = pc_index.query(
-        vector=dummy_vector,     
-        filter=metadata_filter,    
-        top_k=1,
-        include_metadata=True            
+    llm_response = await get_async_groq().chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages
     )
 
-    contexts = response["matches"][0]['metadata']['text']
+    return llm_response.choices[0].message.content
 
-    augmented_query = contexts + table + "\n\n\n\nMY QUESTION:\n" + query
+@METRICS.timed("llm.stream")
+async def complete_stream_async(messages):
 
-    print(len(augmented_query))
+    stream = await get_async_groq().chat.completions.create(
+        model=LLM_MODEL,
+        messages=messages,
+        stream=True
+    )
 
-    system_prompt = f"""
-    You are a science expert. More specifically, your concentration includes science experiments on space. 
+    async for chunk in stream:
 
-    I am a scientists myself as well. However, I don't have expertise in experiments run on an outer space setting. 
+        token = chunk.choices[0].delta.content if chunk.choices else None
 
-    Always consider all of the context and table provided when forming your response.
-    
-    Limit your response to 250 words.
+        if token:
+            yield token
 
-    When responding format your response in bullet points (use newlines if needed).
+def cache_stats():
+    return {"answers": ANSWER_CACHE.stats(), "queries": QUERY_CACHE.stats()}
+
+def cached_complete(messages, query, embedding, accession=None, accessions=()):
 
-    I want you to answer as if you were having a CONVERSATION with me, a scientist. 
-    
-    Also refrain from saying given the information provided or any such expression.  
+    """
+    `complete`, answered from the semantic cache when a close enough question
+    was already asked against the same context.
     """
 
-    groq_client = Groq(api_key=GROQ_API_KEY)
+    context_hash = hash_context(messages, query)
+    response = ANSWER_CACHE.lookup(embedding, accession, context_hash)
 
-    llm_response = groq_client.chat.completions.create(
-        model="llama-3.1-70b-versatile",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": augmented_query}
-        ]
-    )
+    if response is None:
+        response = complete(messages)
+        ANSWER_CACHE.store(embedding, accession, context_hash, response, accessions)
 
-    response = llm_response.choices[0].message.content
-    
     return response
+
+def cached_complete_stream(messages, query, embedding, accession=None, accessions=()):
+
+    """
+    `complete_stream` through the semantic cache. A hit is sent as a single token;
+    a streamed answer is only cached once it has been received in full.
+    """
+
+    context_hash = hash_context(messages, query)
+    response = ANSWER_CACHE.lookup(embedding, accession, context_hash)
+
+    if response is not None:
+        yield response
+        return
+
+    tokens = []
+
+    for token in complete_stream(messages):
+        tokens.append(token)
+        yield token
+
+    ANSWER_CACHE.store(embedding, accession, context_hash, "".join(tokens), accessions)
+
+async def cached_complete_async(messages, query, embedding, accession=None, accessions=()):
+
+    context_hash = hash_context(messages, query)
+    response = ANSWER_CACHE.lookup(embedding, accession, context_hash)
+
+    if response is None:
+        response = await complete_async(messages)
+        ANSWER_CACHE.store(embedding, accession, context_hash, response, accessions)
+
+    return response
+
+async def cached_complete_stream_async(messages, query, embedding, accession=None, accessions=()):
+
+    context_hash = hash_context(messages, query)
+    response = ANSWER_CACHE.lookup(embedding, accession, context_hash)
+
+    if response is not None:
+        yield response
+        return
+
+    tokens = []
+
+    async for token in complete_stream_async(messages):
+        tokens.append(token)
+        yield token
+
+    ANSWER_CACHE.store(embedding, accession, context_hash, "".join(tokens), accessions)
+
+def chatbot(query):
+    embedding, matches = retrieve(query)
+    return cached_complete(build_messages(query, matches), query, embedding, accessions=match_accessions(matches))
+
+def chatbot_stream(query):
+    embedding, matches = retrieve(query)
+    yield from cached_complete_stream(build_messages(query, matches), query, embedding, accessions=match_accessions(matches))
+
+def chatbot_specific(query, table, accession):
+    embedding = get_huggingface_embeddings(query)
+    return cached_complete(get_specific_messages(query, table, accession, embedding), query, embedding, accession)
+
+def chatbot_specific_stream(query, table, accession):
+    embedding = get_huggingface_embeddings(query)
+    yield from cached_complete_stream(get_specific_messages(query, table, accession, embedding), query, embedding, accession)
+
+async def chatbot_async(query):
+    embedding, matches = await retrieve_async(query)
+    return await cached_complete_async(build_messages(query, matches), query, embedding, accessions=match_accessions(matches))
+
+async def chatbot_stream_async(query):
+    embedding, matches = await retrieve_async(query)
+    async for token in cached_complete_stream_async(build_messages(query, matches), query, embedding, accessions=match_accessions(matches)):
+        yield token
+
+async def specific_inputs_async(query, table, accession):
+
+    """
+    The query embedding and the specific prompt built from it.
+    """
+
+    with METRICS.span("embedding.wait"):
+        embedding = await asyncio.wrap_future(EMBEDDINGS.submit(query))
+
+    return await get_specific_messages_async(query, table, accession, embedding), embedding
+
+async def chatbot_specific_async(query, table, accession):
+    messages, embedding = await specific_inputs_async(query, table, accession)
+    return await cached_complete_async(messages, query, embedding, accession)
+
+async def chatbot_specific_stream_async(query, table, accession):
+    messages, embedding = await specific_inputs_async(query, table, accession)
+    async for token in cached_complete_stream_async(messages, query, embedding, accession):
+        yield token
@@ -0,0 +1,200 @@
+from constants import CHUNK_MAX_TOKENS, CHARS_PER_TOKEN
+from render import escape
+
+import xml.etree.ElementTree as ET
+
+# Chunk name -> document elements it covers (see render.render_document)
+SECTIONS = {
+    "description": ["DESCRIPTION", "ORGANISM", "PROJECT"],
+    "factors": ["FACTORS"],
+    "protocols": ["PROTOCOLS"],
+    "collaborators": ["COLLABORATORS"],
+    "payload": ["PAYLOAD"],
+    "mission": ["MISSIONS"],
+}
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def chunk_id(accession: str, section: str, part: int = 0) -> str:
+    return f"{accession}#{section}" if part == 0 else f"{accession}#{section}-{part}"
+
+def word_runs(text: str, size: int) -> list:
+
+    """
+    `text` cut at whitespace into runs of at most about `size` characters.
+    """
+
+    runs = []
+
+    for word in text.split():
+        if runs and len(runs[-1]) + len(word) < size:
+            runs[-1] += " " + word
+        else:
+            runs.append(word)
+
+    return runs
+
+def element_records(element) -> list:
+
+    """
+    `(xml, text)` records of a section element: one per record for structured
+    sections (a <Protocol>, or a <Name> with the fields that follow it), or a
+    single record for plain text.
+    """
+
+    children = list(element)
+
+    if not children:
+        lines = [line.strip() for line in (element.text or "").splitlines() if line.strip()]
+        return [("\n".join(escape(line) for line in lines), " ".join(lines))]
+
+    groups = []
+
+    for child in children:
+
+        child.tail = None
+
+        if child.tag == children[0].tag or not groups:
+            groups.append([child])
+        else:
+            groups[-1].append(child)
+
+    return [
+        (
+            "\n".join(ET.tostring(child, encoding="unicode").strip() for child in group),
+            " ".join(word for child in group for word in " ".join(child.itertext()).split()),
+        )
+        for group in groups
+    ]
+
+def document_records(page_content: str) -> dict:
+
+    """
+    Section tag -> records, taken from the renderer when available, else parsed from the XML.
+    """
+
+    records = getattr(page_content, "records", None)
+
+    if records is not None:
+        return records
+
+    root = ET.fromstring(page_content)
+
+    return {
+        tag: element_records(element)
+        for tags in SECTIONS.values()
+        for tag in tags
+        if (element := root.find(tag)) is not None
+    }
+
+def record_pieces(records: list, max_tokens: int = CHUNK_MAX_TOKENS) -> list:
+
+    """
+    The smallest `(xml, text)` pieces a chunk boundary may fall between: whole
+    records, except that records too large to share a chunk are cut into runs of words.
+    """
+
+    size = max_tokens * CHARS_PER_TOKEN // 2
+    pieces = []
+
+    for xml, text in records:
+
+        if estimate_tokens(xml) > max_tokens // 2:
+            pieces += [(escape(run), run) for run in word_runs(text, size)]
+        else:
+            pieces.append((xml, text))
+
+    return pieces
+
+def render_chunk(header: str, blocks: list) -> str:
+
+    body = ""
+
+    for tag, pieces in blocks:
+        body += f"<{tag}>\n" + "\n".join(xml for xml, _ in pieces) + f"\n</{tag}>\n"
+
+    return f"<CONTENT>\n{header}{body}</CONTENT>"
+
+def split_document(metadata: dict, page_content: str, max_tokens: int = CHUNK_MAX_TOKENS) -> list:
+
+    """
+    Split a rendered study document into section chunks of at most about
+    `max_tokens` tokens. Returns `(id, metadata, text, embedding_text)`: `text`
+    is the XML put in prompts, repeating the accession and title so a chunk
+    stands alone, and `embedding_text` is the same content as plain text. A
+    section too large for one chunk continues in `<accession>#<section>-1`, `-2`, ...
+    """
+
+    records = document_records(page_content)
+    accession = metadata["accession"]
+    title = metadata.get("project_title", "")
+
+    header = f"<ACCESSION>\n{escape(accession)}\n</ACCESSION>\n<TITLE>\n{escape(title)}\n</TITLE>\n"
+    budget = max_tokens - estimate_tokens(header)
+
+    chunks = []
+
+    for section, tags in SECTIONS.items():
+
+        parts = [[]]
+        size = 0
+
+        for tag in tags:
+
+            for piece in record_pieces(records.get(tag, []), max_tokens):
+
+                piece_size = estimate_tokens(piece[0])
+
+                if size and size + piece_size > budget:
+                    parts.append([])
+                    size = 0
+
+                blocks = parts[-1]
+
+                if blocks and blocks[-1][0] == tag:
+                    blocks[-1][1].append(piece)
+                else:
+                    blocks.append((tag, [piece]))
+
+                size += piece_size
+
+        for part, blocks in enumerate(blocks for blocks in parts if blocks):
+
+            embedding_text = f"{title}\n{section}: " + " ".join(text for _, pieces in blocks for _, text in pieces)
+
+            chunks.append((
+                chunk_id(accession, section, part),
+                {**metadata, "section": section, "part": part},
+                render_chunk(header, blocks),
+                embedding_text,
+            ))
+
+    return chunks
+
+def assemble(matches: list, budget: int) -> list:
+
+    """
+    Texts of the best `matches` (highest score first) whose total size fits in
+    `budget` tokens. The best match is always included, cut to the budget if needed.
+    """
+
+    texts = []
+    used = 0
+
+    for match in sorted(matches, key=lambda match: match.get("score", 0), reverse=True):
+
+        text = match["metadata"]["text"]
+        size = estimate_tokens(text)
+
+        if not texts and size > budget:
+            texts.append(text[:budget * CHARS_PER_TOKEN])
+            break
+
+        if used + size > budget:
+            continue
+
+        texts.append(text)
+        used += size
+
+    return texts
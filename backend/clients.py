@@ -0,0 +1,41 @@
+from constants import GROQ_API_KEY, GROQ_BASE_URL, IO_WORKERS
+from resources import RESOURCES
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Blocking network calls (Pinecone, Firestore) from the async server; embedding has its own
+# dedicated thread in embeddings.EmbeddingService, so model inference never occupies these
+IO_EXECUTOR = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+
+def create_groq():
+
+    # The Groq SDK (httpx, pydantic) is only imported once a completion is needed
+    from groq import Groq
+
+    return Groq(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL)
+
+def create_async_groq():
+
+    from groq import AsyncGroq
+
+    return AsyncGroq(api_key=GROQ_API_KEY, base_url=GROQ_BASE_URL)
+
+RESOURCES.register("groq", create_groq)
+RESOURCES.register("async_groq", create_async_groq)
+
+def get_groq():
+
+    """
+    Process-wide Groq client; its HTTP connection pool is reused across requests.
+    """
+
+    return RESOURCES.get("groq")
+
+def get_async_groq():
+
+    """
+    Process-wide AsyncGroq client for the async server. It binds to the event
+    loop it is first used on, so only use it from that loop.
+    """
+
+    return RESOURCES.get("async_groq")
@@ -1,52 +1,109 @@
-from langchain_huggingface import HuggingFaceEmbeddings
-
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Override to point the chatbot at another OpenAI-compatible server, e.g. fake_llm.py
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 FIREBASE_ID = os.getenv("FIREBASE_ID")
+FIREBASE_KEY_PATH = os.getenv("FIREBASE_KEY_PATH", "../firebase_config.json")
+
+# Clients and models (resources.py) that the servers create on a background thread at startup,
+# e.g. WARM_RESOURCES=firestore,embedding_model,vector_store; the rest load on first use
+WARM_RESOURCES = [name for name in os.getenv("WARM_RESOURCES", "firestore").split(",") if name]
 
 BASE_URL = "https://osdr.nasa.gov/geode-py/ws/repo/studies/{id}"
 
-BASE_DOCUMENT = """
-<CONTENT>
-    <ACCESSION>
-        {accession}
-    </ACCESSION>
-    <DESCRIPTION>
-        {description}
-    </DESCRIPTION>
-    <FACTORS>
-        {factors}
-    </FACTORS>
-    <ORGANISM>
-        {organism}
-    </ORGANISM>
-    <PROJECT>
-        {project}
-    </PROJECT>
-    <COLLABORATORS>
-        {collaborators}
-    </COLLABORATORS>
-    <PAYLOAD>
-        {payload}
-    </PAYLOAD>
-    <MISSIONS>
-        {mission}
-    </MISSIONS>
-    <PROTOCOLS>
-        {protocols}
-    </PROTOCOLS>
-</CONTENT>
-"""
-
-EMBEDDINGS = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+# Local cache of raw study JSON (see http_cache.py); OSDR_OFFLINE=1 serves from it only
+OSDR_CACHE_DIR = os.getenv("OSDR_CACHE_DIR", ".osdr_cache")
+OSDR_CACHE_MAX_BYTES = int(os.getenv("OSDR_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+OSDR_CACHE_MAX_AGE = float(os.getenv("OSDR_CACHE_MAX_AGE", "3600"))
+OSDR_OFFLINE = os.getenv("OSDR_OFFLINE", "0") == "1"
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_DIM = 384
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_MAX_WAIT = float(os.getenv("EMBEDDING_MAX_WAIT", "0.01"))
 
 INDEX_NAME = "space-apps"
 
+LLM_MODEL = "llama-3.1-70b-versatile"
+
+# Section chunks indexed per study (chunks.py) and the context budget of a chatbot prompt, in estimated tokens
+CHARS_PER_TOKEN = 4
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "12"))
+
+# Shared client pools (clients.py) and per-route concurrency limits for async_server.py
+IO_WORKERS = int(os.getenv("IO_WORKERS", "32"))
+PINECONE_POOL_THREADS = int(os.getenv("PINECONE_POOL_THREADS", "8"))
+ROUTE_CONCURRENCY = {
+    "chatbot": int(os.getenv("CHATBOT_CONCURRENCY", "64")),
+    "documents": int(os.getenv("DOCUMENTS_CONCURRENCY", "256")),
+}
+ROUTE_QUEUE_TIMEOUT = float(os.getenv("ROUTE_QUEUE_TIMEOUT", "30"))
+
+# Documents per embedding pass at ingest time, and vectors per upsert request / parallel upsert requests
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+UPSERT_CHUNK_SIZE = int(os.getenv("UPSERT_CHUNK_SIZE", "100"))
+UPSERT_WORKERS = int(os.getenv("UPSERT_WORKERS", "4"))
+
+# "pinecone" for the hosted index, "local" for the in-process NumPy index in vectorstore.py
+VECTOR_STORE = os.getenv("VECTOR_STORE", "pinecone")
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "vector_index")
+LOCAL_INDEX_IVF_THRESHOLD = int(os.getenv("LOCAL_INDEX_IVF_THRESHOLD", "20000"))
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "86400"))
+QUERY_CACHE_PATH = os.getenv("QUERY_CACHE_PATH")
+
+# Semantic answer cache (semantic_cache.py): a question reuses a cached answer at or above this cosine similarity
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "2048"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "86400"))
+
+CONTEXT_COLLECTION = "Context"
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "256"))
+
+SYNC_COLLECTION = "Sync"
+
+# Columnar Sample/Assay tables (tables.py): JSON bytes per document before columns spill into
+# <collection>Chunks, and the distinct/total value ratio up to which a column is dictionary-encoded
+TABLE_CHUNK_BYTES = int(os.getenv("TABLE_CHUNK_BYTES", str(512 * 1024)))
+TABLE_CATEGORY_RATIO = 0.5
+
+# Cached results of the /api/<collection>/<accession>/aggregate endpoint (aggregate.py)
+AGGREGATE_CACHE_SIZE = int(os.getenv("AGGREGATE_CACHE_SIZE", "1024"))
+AGGREGATE_CACHE_TTL = float(os.getenv("AGGREGATE_CACHE_TTL", "3600"))
+
+# Catalog summaries served from memory by summary_index.py, reloaded from Firestore this often (seconds)
+SUMMARY_COLLECTION = "Summary"
+SUMMARY_RELOAD_INTERVAL = float(os.getenv("SUMMARY_RELOAD_INTERVAL", "300"))
+
+# Read-through cache in DB.get_document; TTLs are in seconds per collection
+DB_CACHE_ENABLED = os.getenv("DB_CACHE", "1") == "1"
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "2048"))
+DB_CACHE_DEFAULT_TTL = 300
+DB_CACHE_TTLS = {
+    "Project": 3600,
+    "Sample": 3600,
+    "Assay": 3600,
+    "SampleChunks": 3600,
+    "AssayChunks": 3600,
+    "Context": 3600,
+}
+DB_CACHE_WARM = ["Project"]
+
+# Per-stage timing (metrics.py), served in Prometheus format at /api/metrics; TRACE_LOG appends one
+# JSON line of spans per request to that file. With both off, instrumentation is compiled out
+METRICS_ENABLED = os.getenv("METRICS", "1") == "1"
+METRICS_PREFIX = "spaceapps"
+TRACE_LOG_PATH = os.getenv("TRACE_LOG")
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
 HEADERS = {
     'User-Agent': 'Mozilla/5.0',
     'Accept-Language': 'en-US,en;q=0.9',
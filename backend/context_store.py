@@ -0,0 +1,58 @@
+from constants import CONTEXT_COLLECTION, CONTEXT_CACHE_SIZE
+from cache import LRUCache
+from db import DB
+
+class ContextStore:
+
+    """
+    Accession -> rendered study document, filled by `parse.create_document`.
+
+    Lookups hit an in-memory LRU first and fall back to a single Firestore
+    document read, so fetching one study's context never touches the vector index.
+    """
+
+    def __init__(self, collection: str = CONTEXT_COLLECTION, max_size: int = CONTEXT_CACHE_SIZE):
+
+        self.collection = collection
+        self._cache = LRUCache(max_size=max_size)
+
+    def get(self, accession: str):
+
+        text = self._cache.get(accession)
+
+        if text is not None:
+            return text
+
+        document = DB.get_document(self.collection, accession)
+
+        if document is None:
+            return None
+
+        text = document["text"]
+        self._cache.set(accession, text)
+
+        return text
+
+    def record(self, accession: str, text: str) -> dict:
+
+        """
+        The Firestore document stored for `accession`, for callers batching their own writes.
+        """
+
+        return {"accession": accession, "text": text}
+
+    def put(self, accession: str, text: str):
+
+        DB.add_document(self.collection, self.record(accession, text), accession)
+        self.remember(accession, text)
+
+    def remember(self, accession: str, text: str):
+        self._cache.set(accession, text)
+
+    def invalidate(self, accession: str):
+        self._cache.invalidate(accession)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+CONTEXTS = ContextStore()
@@ -1,58 +1,142 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+from constants import FIREBASE_KEY_PATH, FIREBASE_ID
+from resources import RESOURCES
+
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from cache import LRUCache
+from metrics import METRICS
+
+# Firestore rejects batched writes with more than 500 operations
+MAX_BATCH_SIZE = 500
+
+# firestore.FieldPath.document_id(), the field path Firestore uses for ordering by document ID
+DOCUMENT_ID = "__name__"
+
+def connect(firebase_key_path, project_id):
+    """Initialize the Firebase app and return its Firestore client."""
+    # firebase_admin pulls in the Google Cloud and gRPC libraries; only import it once a client is needed
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    cred = credentials.Certificate(firebase_key_path)
+    firebase_admin.initialize_app(cred, {
+        'projectId': project_id,
+    })
+    return firestore.client()
+
+RESOURCES.register("firestore", lambda: connect(FIREBASE_KEY_PATH, FIREBASE_ID))
 
 class DB:
-    # Static class variable to hold the Firestore client
-    _db = None
+    # The Firestore client is the "firestore" resource, connected on first use (see client)
+    # Optional read-through cache of (collection, document ID) -> document, see enable_cache
+    _cache = None
+    _cache_ttls = {}
 
     @staticmethod
     def initialize(firebase_key_path, project_id):
-        """Initialize Firestore with Firebase credentials."""
-        cred = credentials.Certificate(firebase_key_path)
-        firebase_admin.initialize_app(cred, {
-            'projectId': project_id,
-        })
-        DB._db = firestore.client()
+        """Use these Firebase credentials; the connection is made on first use."""
+        RESOURCES.register("firestore", lambda: connect(firebase_key_path, project_id))
+
+    @staticmethod
+    def client():
+        """The Firestore client, connecting first if needed."""
+        return RESOURCES.get("firestore")
 
     @staticmethod
+    def enable_cache(max_size=2048, ttls=None, default_ttl=300):
+        """Cache get_document results in a bounded LRU, with per-collection TTLs in seconds."""
+        DB._cache = LRUCache(max_size=max_size, ttl=default_ttl)
+        DB._cache_ttls = dict(ttls or {})
+
+    @staticmethod
+    def cache_stats():
+        """Hit/miss statistics of the read-through cache, or None when it is disabled."""
+        return DB._cache.stats() if DB._cache is not None else None
+
+    @staticmethod
+    @METRICS.timed("db.warm_cache")
+    def warm_cache(collection_names):
+        """Load every document of the given collections into the cache."""
+        if DB._cache is None:
+            return
+        for collection_name in collection_names:
+            count = 0
+            for doc in DB.client().collection(collection_name).stream():
+                DB._cache_document(collection_name, doc.id, doc.to_dict())
+                count += 1
+            print(f"Warmed cache with {count} documents from {collection_name}.")
+
+    @staticmethod
+    def _cache_document(collection_name, document_id, document):
+        DB._cache.set((collection_name, document_id), document, ttl=DB._cache_ttls.get(collection_name))
+
+    @staticmethod
+    def _invalidate(collection_name, document_id=None):
+        if DB._cache is None:
+            return
+        if document_id is None:
+            DB._cache.invalidate_where(lambda key: key[0] == collection_name)
+        else:
+            DB._cache.invalidate((collection_name, document_id))
+
+    @staticmethod
+    @METRICS.timed("db.add_document")
     def add_document(collection_name, document_data, document_id=None):
         """Add a new document to a collection, with an optional document ID."""
         if document_id:
-            doc_ref = DB._db.collection(collection_name).document(document_id)
+            doc_ref = DB.client().collection(collection_name).document(document_id)
             doc_ref.set(document_data)
+            DB._invalidate(collection_name, document_id)
             print(f"Document {document_id} added successfully.")
         else:
-            DB._db.collection(collection_name).add(document_data)
+            DB.client().collection(collection_name).add(document_data)
             print(f"Document added successfully with auto-generated ID.")
 
     @staticmethod
+    @METRICS.timed("db.get_document")
     def get_document(collection_name, document_id):
-        """Retrieve a document by its ID from a collection."""
-        doc_ref = DB._db.collection(collection_name).document(document_id)
+        """Retrieve a document by its ID from a collection.
+
+        With the cache enabled the same dict is returned to every caller, so treat
+        it as read-only; copy it before changing it.
+        """
+        if DB._cache is not None:
+            cached = DB._cache.get((collection_name, document_id))
+            if cached is not None:
+                return cached
+        doc_ref = DB.client().collection(collection_name).document(document_id)
         doc = doc_ref.get()
         if doc.exists:
-            return doc.to_dict()
+            document = doc.to_dict()
+            if DB._cache is not None:
+                DB._cache_document(collection_name, document_id, document)
+            return document
         else:
             return None
 
     @staticmethod
+    @METRICS.timed("db.update_document")
     def update_document(collection_name, document_id, updates):
         """Update specific fields of a document."""
-        doc_ref = DB._db.collection(collection_name).document(document_id)
+        doc_ref = DB.client().collection(collection_name).document(document_id)
         doc_ref.update(updates)
+        DB._invalidate(collection_name, document_id)
         print(f"Document {document_id} updated successfully.")
 
     @staticmethod
+    @METRICS.timed("db.delete_document")
     def delete_document(collection_name, document_id):
         """Delete a document from a collection."""
-        doc_ref = DB._db.collection(collection_name).document(document_id)
+        doc_ref = DB.client().collection(collection_name).document(document_id)
         doc_ref.delete()
+        DB._invalidate(collection_name, document_id)
         print(f"Document {document_id} deleted successfully.")
 
     @staticmethod
+    @METRICS.timed("db.query_documents")
     def query_documents(collection_name, field, operation, value):
         """Query a collection for documents matching certain criteria."""
-        collection_ref = DB._db.collection(collection_name)
+        collection_ref = DB.client().collection(collection_name)
         query = collection_ref.where(field, operation, value).stream()
 
         results = []
@@ -63,9 +147,11 @@ class DB:
         return results
 
     @staticmethod
+    @METRICS.timed("db.delete_collection")
     def delete_collection(collection_name, batch_size=10):
         """Delete all documents in a collection (batch delete)."""
-        coll_ref = DB._db.collection(collection_name)
+        coll_ref = DB.client().collection(collection_name)
+        DB._invalidate(collection_name)
         docs = coll_ref.limit(batch_size).stream()
         deleted = 0
         for doc in docs:
@@ -76,12 +162,98 @@ class DB:
             return DB.delete_collection(collection_name, batch_size)
 
     @staticmethod
+    @METRICS.timed("db.get_all_documents")
     def get_all_documents(collection_name):
         """Retrieve all documents from a collection."""
-        collection_ref = DB._db.collection(collection_name)
+        collection_ref = DB.client().collection(collection_name)
         docs = collection_ref.stream()
         all_documents = []
         for doc in docs:
             document = doc.to_dict()
             all_documents.append(document)
         return all_documents
+
+    @staticmethod
+    @METRICS.timed("db.write_many")
+    def write_many(operations, batch_size=MAX_BATCH_SIZE, max_workers=4, retries=3):
+        """Apply (op, collection, document_id, data) operations as batched commits.
+
+        `op` is "set", "update" or "delete" (data is ignored for deletes); a None
+        document_id on a "set" gets an auto-generated ID. Operations are split into
+        chunks of at most `batch_size`, committed in parallel, and each chunk is
+        retried with backoff as a whole since a batch commits atomically. Returns
+        one {"collection", "id", "status", "error"} entry per operation, in order.
+        """
+        operations = list(operations)
+        chunks = [operations[start:start + batch_size] for start in range(0, len(operations), batch_size)]
+
+        def commit(chunk):
+            client = DB.client()
+            for attempt in range(retries + 1):
+                batch = client.batch()
+                ids = []
+                for op, collection_name, document_id, data in chunk:
+                    collection_ref = client.collection(collection_name)
+                    doc_ref = collection_ref.document(document_id) if document_id else collection_ref.document()
+                    ids.append(doc_ref.id)
+                    if op == "set":
+                        batch.set(doc_ref, data)
+                    elif op == "update":
+                        batch.update(doc_ref, data)
+                    elif op == "delete":
+                        batch.delete(doc_ref)
+                    else:
+                        raise ValueError(f"Unknown write operation: {op}")
+                try:
+                    batch.commit()
+                    for (_, collection_name, _, _), document_id in zip(chunk, ids):
+                        DB._invalidate(collection_name, document_id)
+                    return [
+                        {"collection": operation[1], "id": document_id, "status": "ok", "error": None}
+                        for operation, document_id in zip(chunk, ids)
+                    ]
+                except Exception as e:
+                    error = e
+                    if attempt < retries:
+                        time.sleep(0.5 * 2 ** attempt)
+            return [
+                {"collection": operation[1], "id": document_id, "status": "error", "error": str(error)}
+                for operation, document_id in zip(chunk, ids)
+            ]
+
+        if len(chunks) <= 1:
+            results = [commit(chunk) for chunk in chunks]
+        else:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+                results = list(executor.map(commit, chunks))
+
+        statuses = [status for chunk_statuses in results for status in chunk_statuses]
+        failed = sum(status["status"] != "ok" for status in statuses)
+        print(f"Wrote {len(statuses) - failed}/{len(statuses)} documents in {len(chunks)} batch(es).")
+        return statuses
+
+    @staticmethod
+    @METRICS.timed("db.add_documents_bulk")
+    def add_documents_bulk(collection_name, documents, **kwargs):
+        """Set many documents in one collection; `documents` maps document ID to data."""
+        operations = [("set", collection_name, document_id, data) for document_id, data in documents.items()]
+        return DB.write_many(operations, **kwargs)
+
+    @staticmethod
+    @METRICS.timed("db.stream_documents")
+    def stream_documents(collection_name, fields=None, limit=None, after=None):
+        """Yield (document ID, data) pairs ordered by ID, optionally projected and paginated.
+
+        `fields` limits the returned fields server-side (Firestore select), `after`
+        is the ID of the last document of the previous page.
+        """
+        query = DB.client().collection(collection_name)
+        if fields:
+            query = query.select(fields)
+        query = query.order_by(DOCUMENT_ID)
+        if after:
+            query = query.start_after({DOCUMENT_ID: after})
+        if limit:
+            query = query.limit(limit)
+        for doc in query.stream():
+            yield doc.id, doc.to_dict()
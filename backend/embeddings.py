@@ -0,0 +1,157 @@
+from constants import EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WAIT
+from resources import RESOURCES
+from metrics import METRICS
+
+from concurrent.futures import Future
+import threading
+import queue
+import time
+
+class EmbeddingService:
+
+    """
+    Process-wide embedding model shared by the chatbot, ingestion and langchain.
+
+    The SentenceTransformer is a registered resource (see resources.py):
+    sentence_transformers and torch are imported and the model loaded on
+    first use, or by a warm-up, not on import. Small encode requests
+    coming from concurrent threads are grouped into micro-batches so they share
+    a single forward pass; a batch is flushed as soon as it is full or once
+    `max_wait` seconds have passed since its first request.
+    """
+
+    def __init__(self, model_name: str, max_batch_size: int = 64, max_wait: float = 0.01, resource: str = "embedding_model"):
+
+        self.model_name = model_name
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.resource = resource
+
+        RESOURCES.register(resource, self.load_model)
+
+        self._requests = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    def load_model(self):
+
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(self.model_name)
+
+    @property
+    def model(self):
+        return RESOURCES.get(self.resource)
+
+    @METRICS.timed("embedding.encode")
+    def encode(self, text):
+
+        """
+        Encode a string or a list of strings, mirroring `SentenceTransformer.encode`:
+        a single string gives a 1-D array, a list gives one row per string.
+        """
+
+        single = isinstance(text, str)
+        texts = [text] if single else list(text)
+
+        if not texts:
+            return self.model.encode(texts)
+
+        if self.max_wait <= 0 or len(texts) >= self.max_batch_size:
+            embeddings = self.model.encode(texts, batch_size=self.max_batch_size)
+            return embeddings[0] if single else embeddings
+
+        return self.submit(text).result()
+
+    def submit(self, text) -> Future:
+
+        """
+        Queue a string or list of strings on the batching thread without blocking;
+        the returned future resolves to what `encode` would return. Async callers
+        can await it with `asyncio.wrap_future`.
+        """
+
+        single = isinstance(text, str)
+        texts = [text] if single else list(text)
+
+        self._ensure_worker()
+
+        future = Future()
+        self._requests.put((texts, single, future))
+
+        return future
+
+    def embed_documents(self, texts: list) -> list:
+
+        """
+        LangChain `Embeddings` interface, used by `PineconeVectorStore`.
+        """
+
+        return [embedding.tolist() for embedding in self.encode(texts)]
+
+    def embed_query(self, text: str) -> list:
+
+        """
+        LangChain `Embeddings` interface, used by `PineconeVectorStore`.
+        """
+
+        return self.encode(text).tolist()
+
+    def _ensure_worker(self):
+
+        if self._worker is not None:
+            return
+
+        with self._worker_lock:
+
+            if self._worker is None:
+
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect_batch(self) -> list:
+
+        batch = [self._requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+
+            remaining = deadline - time.monotonic()
+
+            if remaining <= 0:
+                break
+
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+            batch.append(request)
+            size += len(request[0])
+
+        return batch
+
+    def _run(self):
+
+        while True:
+
+            batch = self._collect_batch()
+            texts = [text for request_texts, _, _ in batch for text in request_texts]
+
+            try:
+                with METRICS.span("embedding.batch"):
+                    embeddings = self.model.encode(texts, batch_size=self.max_batch_size)
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_texts, single, future in batch:
+
+                result = embeddings[offset:offset + len(request_texts)]
+                future.set_result(result[0] if single else result)
+                offset += len(request_texts)
+
+EMBEDDINGS = EmbeddingService(EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_WAIT)
@@ -0,0 +1,113 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import argparse
+import json
+import time
+
+DEFAULT_ANSWER = "- Microgravity changes bone density in mice.\n- Gene expression shifts in muscle tissue.\n- Effects partly reverse after return to Earth."
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+
+    """
+    Minimal OpenAI/Groq-compatible chat completions endpoint for local testing.
+
+    Point the chatbot at it with GROQ_BASE_URL=http://127.0.0.1:<port>. Streaming
+    requests get the answer word by word as Server-Sent Events, `delay` seconds apart.
+    """
+
+    answer = DEFAULT_ANSWER
+    delay = 0.05
+
+    def do_POST(self):
+
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+
+        if request.get("stream"):
+            self._stream(request)
+        else:
+            self._complete(request)
+
+    def _chunk(self, request, delta, finish_reason=None) -> dict:
+
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    def _stream(self, request):
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        words = self.answer.split(" ")
+
+        for index, word in enumerate(words):
+
+            token = word if index == 0 else " " + word
+            self._send_event(self._chunk(request, {"role": "assistant", "content": token}))
+            time.sleep(self.delay)
+
+        self._send_event(self._chunk(request, {}, "stop"))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, payload: dict):
+
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _complete(self, request):
+
+        time.sleep(self.delay * len(self.answer.split(" ")))
+
+        body = json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.answer},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port: int = 8001, delay: float = FakeLLMHandler.delay) -> ThreadingHTTPServer:
+
+    """
+    Build a fake LLM server on 127.0.0.1:`port` (0 picks a free port); call `serve_forever` on it.
+    """
+
+    handler = type("Handler", (FakeLLMHandler,), {"delay": delay})
+
+    return ThreadingHTTPServer(("127.0.0.1", port), handler)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Fake streaming LLM server.")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--delay", type=float, default=FakeLLMHandler.delay, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.delay)
+    print(f"Fake LLM listening on http://127.0.0.1:{server.server_address[1]}")
+    server.serve_forever()
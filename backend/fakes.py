@@ -0,0 +1,392 @@
+"""
+In-process stand-ins for the external services, for offline benchmarks and local runs.
+
+    FakeFirestore      the subset of the Firestore client that db.DB uses
+    FakeOSDRAdapter    a `requests` transport adapter answering OSDR study URLs
+    HashingModel       a deterministic replacement for the SentenceTransformer
+    synthetic_study    OSDR study JSON of a chosen size
+
+The LLM has its own fake server in fake_llm.py, and the vector store can run
+locally with VECTOR_STORE=local (vectorstore.LocalVectorStore).
+"""
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+import threading
+import hashlib
+import random
+import copy
+import json
+import time
+import uuid
+import re
+
+import numpy as np
+
+# Vocabulary of synthetic study text. This module imports nothing from the pipeline, so it
+# can be loaded before the environment that constants.py reads is set up
+WORDS = "microgravity tissue expression mouse flight ground control radiation bone muscle sample assay sequencing library buffer".split()
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + "."
+
+class FakeSnapshot:
+
+    def __init__(self, reference, data):
+
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+class FakeDocumentReference:
+
+    def __init__(self, store, collection: str, id: str):
+
+        self._store = store
+        self._collection = collection
+        self.id = id
+
+    def get(self) -> FakeSnapshot:
+
+        self._store.wait()
+
+        return FakeSnapshot(self, self._store.read(self._collection, self.id))
+
+    def set(self, data: dict):
+
+        self._store.wait()
+        self._store.write(self._collection, self.id, data)
+
+    def update(self, updates: dict):
+
+        self._store.wait()
+        self._store.write(self._collection, self.id, updates, merge=True)
+
+    def delete(self):
+
+        self._store.wait()
+        self._store.write(self._collection, self.id, None)
+
+class FakeQuery:
+
+    """
+    Collection queries as DB builds them: equality `where`, `select`, ordering by
+    document ID, `start_after` and `limit`.
+    """
+
+    def __init__(self, store, collection: str):
+
+        self._store = store
+        self._collection = collection
+        self._filters = []
+        self._fields = None
+        self._after = None
+        self._limit = None
+
+    def _copy(self, **changes):
+
+        query = copy.copy(self)
+        query._filters = list(self._filters)
+        query.__dict__.update(changes)
+
+        return query
+
+    def where(self, field: str, operation: str, value):
+
+        if operation != "==":
+            raise NotImplementedError(f"FakeFirestore only supports == filters, not {operation}")
+
+        return self._copy(_filters=[*self._filters, (field, value)])
+
+    def select(self, fields: list):
+        return self._copy(_fields=list(fields))
+
+    def order_by(self, field):
+        # Results are always ordered by document ID, which is the only ordering DB asks for
+        return self
+
+    def start_after(self, cursor: dict):
+        return self._copy(_after=next(iter(cursor.values())))
+
+    def limit(self, count: int):
+        return self._copy(_limit=count)
+
+    def stream(self):
+
+        self._store.wait()
+
+        results = []
+
+        for id, data in sorted(self._store.documents(self._collection).items()):
+
+            if self._after is not None and id <= self._after:
+                continue
+
+            if any(data.get(field) != value for field, value in self._filters):
+                continue
+
+            if self._fields is not None:
+                data = {field: data[field] for field in self._fields if field in data}
+
+            results.append(FakeSnapshot(FakeDocumentReference(self._store, self._collection, id), data))
+
+            if self._limit is not None and len(results) >= self._limit:
+                break
+
+        return iter(results)
+
+class FakeCollection(FakeQuery):
+
+    def document(self, id: str = None) -> FakeDocumentReference:
+        return FakeDocumentReference(self._store, self._collection, id or uuid.uuid4().hex[:20])
+
+    def add(self, data: dict):
+
+        reference = self.document()
+        reference.set(data)
+
+        return None, reference
+
+class FakeBatch:
+
+    def __init__(self, store):
+
+        self._store = store
+        self._writes = []
+
+    def set(self, reference, data: dict):
+        self._writes.append((reference, data, False))
+
+    def update(self, reference, updates: dict):
+        self._writes.append((reference, updates, True))
+
+    def delete(self, reference):
+        self._writes.append((reference, None, False))
+
+    def commit(self):
+
+        # One round trip for the whole batch, like a real commit
+        self._store.wait()
+
+        with self._store.lock:
+            for reference, data, merge in self._writes:
+                self._store.write(reference._collection, reference.id, data, merge)
+
+class FakeFirestore:
+
+    """
+    In-memory Firestore client. Documents are deep-copied on the way in and
+    out, as they would be serialized by the real client, and every round trip
+    (a document read or write, a query, a batch commit) sleeps `latency` seconds.
+    """
+
+    def __init__(self, latency: float = 0.0):
+
+        self.latency = latency
+        self.lock = threading.RLock()
+        self.round_trips = 0
+
+        self._collections = {}
+
+    def wait(self):
+
+        self.round_trips += 1
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def collection(self, name: str) -> FakeCollection:
+        return FakeCollection(self, name)
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def documents(self, collection: str) -> dict:
+
+        with self.lock:
+            return {id: copy.deepcopy(data) for id, data in self._collections.get(collection, {}).items()}
+
+    def read(self, collection: str, id: str):
+
+        with self.lock:
+            return copy.deepcopy(self._collections.get(collection, {}).get(id))
+
+    def write(self, collection: str, id: str, data, merge: bool = False):
+
+        with self.lock:
+
+            documents = self._collections.setdefault(collection, {})
+
+            if data is None:
+                documents.pop(id, None)
+            elif merge:
+                if id not in documents:
+                    raise KeyError(f"No document to update: {collection}/{id}")
+                documents[id].update(copy.deepcopy(data))
+            else:
+                documents[id] = copy.deepcopy(data)
+
+    def install(self):
+
+        """
+        Make db.DB use this client, including after a later `DB.initialize` call.
+        """
+
+        from resources import RESOURCES
+
+        RESOURCES.set("firestore", self)
+
+        return self
+
+class FakeOSDRAdapter(BaseAdapter):
+
+    """
+    Answers GET requests for OSDR study URLs (…/studies/<accession>) from
+    `studies`, a dict of accession -> study JSON, after `latency` seconds.
+    Unknown accessions get a 404. Mount it on the session parse.get_json uses:
+
+        parse.SESSION.mount("https://osdr.nasa.gov/", FakeOSDRAdapter(studies))
+    """
+
+    def __init__(self, studies: dict, latency: float = 0.0):
+
+        super().__init__()
+
+        self.studies = studies
+        self.latency = latency
+        self.requests = 0
+
+    def send(self, request, **kwargs) -> Response:
+
+        self.requests += 1
+
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+        response = Response()
+        response.url = request.url
+        response.request = request
+
+        match = re.search(r"/studies/([^/?]+)", request.url)
+        study = self.studies.get(match.group(1)) if match else None
+
+        if study is None:
+            response.status_code = 404
+            response._content = b'{"error": "not found"}'
+        else:
+            response.status_code = 200
+            response._content = json.dumps(study).encode("utf-8")
+
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+
+        return response
+
+    def close(self):
+        pass
+
+class HashingModel:
+
+    """
+    SentenceTransformer stand-in: `encode` maps each text to a unit vector built
+    from hashed word counts, so identical texts get identical embeddings and
+    texts sharing words are similar. Use it in place of the real model with
+    `RESOURCES.set("embedding_model", HashingModel())`.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def encode(self, texts, batch_size: int = 32, **kwargs):
+
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                embeddings[row, int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "little") % self.dim] += 1.0
+
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.where(norms == 0, 1.0, norms)
+
+        return embeddings[0] if single else embeddings
+
+def synthetic_study(accession: str, samples: int = 100, protocols: int = 10, contacts: int = 5, seed: int = 0) -> dict:
+
+    """
+    Study JSON shaped like the OSDR API response `parse.create_document` reads,
+    with `samples` rows in both the sample and the assay table.
+    """
+
+    rng = random.Random(f"{accession}-{seed}")
+    sample_names = [f"{accession}_S{i}" for i in range(samples)]
+
+    sample_header = ["Source Name", "Sample Name", "Characteristics[Organism]", "Characteristics[Strain]", "Factor Value[Spaceflight]", "Factor Value[Dissection Condition]", "Comment[Age]"]
+    assay_header = ["Sample Name", "Protocol REF", "Extract Name", "Parameter Value[QA Score]", "Parameter Value[rRNA Contamination]", "Parameter Value[library layout]", "Comment[Notes]"]
+
+    return {
+        "accession": accession,
+        "title": sentence(rng, 8),
+        "description": " ".join(sentence(rng, 20) for _ in range(10)),
+        "factors": [{"factorName": "Spaceflight"}, {"factorName": "Dissection Condition"}],
+        "organisms": {"links": {"Mus musculus": "https://www.ncbi.nlm.nih.gov/taxonomy/10090"}},
+        "projectTitle": sentence(rng, 6),
+        "projectType": "Spaceflight Study",
+        "flightProgram": "International Space Station (ISS)",
+        "experimentPlatform": "ISS",
+        "spaceProgram": "NASA",
+        "managingNasaCenter": "Ames Research Center",
+        "funding": sentence(rng, 4),
+        "contacts": [
+            {
+                "firstName": f"First{i}",
+                "lastName": f"Last{i}",
+                "email": f"user{i}@example.org",
+                "affiliation": sentence(rng, 4),
+                "roles": [{"annotationValue": "Investigator"}],
+            }
+            for i in range(contacts)
+        ],
+        "payloads": [{"identifier": "RR-1", "payloadName": sentence(rng, 3), "description": sentence(rng, 30)}],
+        "missionName": "SpaceX-4",
+        "missionStart": "09/21/2014",
+        "missionEnd": "10/25/2014",
+        "protocols": [{"name": f"Protocol {i}", "description": " ".join(sentence(rng, 25) for _ in range(6))} for i in range(protocols)],
+        "samples": {
+            "header": [{"field": field} for field in sample_header],
+            "table": [
+                {
+                    "Source Name": f"{name}_source",
+                    "Sample Name": name,
+                    "Characteristics[Organism]": "Mus musculus",
+                    "Characteristics[Strain]": rng.choice(["C57BL/6J", "BALB/c"]),
+                    "Factor Value[Spaceflight]": rng.choice(["Space Flight", "Ground Control", "Basal Control"]),
+                    "Factor Value[Dissection Condition]": rng.choice(["Upon euthanasia", "Carcass"]),
+                    "Comment[Age]": str(rng.randint(8, 32)),
+                }
+                for name in sample_names
+            ],
+        },
+        "assays": [{
+            "table": {
+                "header": [{"field": field} for field in assay_header],
+                "table": [
+                    {
+                        "Sample Name": name,
+                        "Protocol REF": "nucleic acid sequencing",
+                        "Extract Name": f"{name}_extract",
+                        "Parameter Value[QA Score]": f"{rng.uniform(20, 40):.2f}",
+                        "Parameter Value[rRNA Contamination]": f"{rng.uniform(0, 10):.2f}",
+                        "Parameter Value[library layout]": rng.choice(["PAIRED", "SINGLE"]),
+                        "Comment[Notes]": sentence(rng, 5),
+                    }
+                    for name in sample_names
+                ],
+            },
+        }],
+    }
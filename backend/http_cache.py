@@ -0,0 +1,251 @@
+from constants import OSDR_CACHE_DIR, OSDR_CACHE_MAX_BYTES, OSDR_CACHE_MAX_AGE, OSDR_OFFLINE
+
+import threading
+import hashlib
+import json
+import gzip
+import time
+import os
+
+class OfflineCacheMiss(LookupError):
+    pass
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class ResponseCache:
+
+    """
+    On-disk cache of raw OSDR API responses.
+
+    Bodies are stored gzip-compressed under `objects/`, named by the SHA-256 of
+    their content, so identical responses are stored once. Each URL has a small
+    record under `urls/` with the object it points to and its ETag/Last-Modified
+    validators; the record's mtime doubles as its last-access time for LRU
+    eviction once the objects exceed `max_bytes`.
+
+    Entries younger than `max_age` seconds are served without any request; older
+    ones are revalidated with a conditional GET. In `offline` mode nothing is
+    fetched and a missing entry raises `OfflineCacheMiss`.
+    """
+
+    def __init__(self, directory: str = OSDR_CACHE_DIR, max_bytes: int = OSDR_CACHE_MAX_BYTES, max_age: float = OSDR_CACHE_MAX_AGE, offline: bool = OSDR_OFFLINE):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.offline = offline
+
+        self._objects = os.path.join(directory, "objects")
+        self._urls = os.path.join(directory, "urls")
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+        os.makedirs(self._objects, exist_ok=True)
+        os.makedirs(self._urls, exist_ok=True)
+
+    def lookup(self, url: str):
+
+        """
+        Return the cached record for `url`, or None.
+        """
+
+        path = self._record_path(url)
+
+        try:
+            with open(path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not os.path.exists(self._object_path(record["object"])):
+            return None
+
+        return record
+
+    def is_fresh(self, record: dict) -> bool:
+        return time.time() - record["fetched_at"] < self.max_age
+
+    def conditional_headers(self, record: dict) -> dict:
+
+        headers = {}
+
+        if record is None:
+            return headers
+
+        if record.get("etag"):
+            headers["If-None-Match"] = record["etag"]
+
+        if record.get("last_modified"):
+            headers["If-Modified-Since"] = record["last_modified"]
+
+        return headers
+
+    def load(self, record: dict) -> dict:
+
+        """
+        Decode a cached body and mark its URL as recently used.
+        """
+
+        with gzip.open(self._object_path(record["object"]), "rb") as f:
+            data = json.loads(f.read())
+
+        try:
+            os.utime(self._record_path(record["url"]))
+        except OSError:
+            pass
+
+        return data
+
+    def revalidated(self, record: dict) -> dict:
+
+        """
+        Handle a 304 for `record`: refresh its fetch time and return the cached body.
+        """
+
+        record["fetched_at"] = time.time()
+        self._write_record(record)
+
+        return self.load(record)
+
+    def store(self, url: str, body: bytes, headers) -> dict:
+
+        """
+        Cache a 200 response body for `url` and return it decoded.
+        """
+
+        data = json.loads(body)
+        digest = _sha256(body)
+        object_path = self._object_path(digest)
+
+        with self._lock:
+
+            if not os.path.exists(object_path):
+
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+
+                tmp_path = f"{object_path}.{threading.get_ident()}.tmp"
+                with gzip.open(tmp_path, "wb") as f:
+                    f.write(body)
+                os.replace(tmp_path, object_path)
+
+                self._add_bytes(os.path.getsize(object_path))
+
+            self._write_record({
+                "url": url,
+                "object": digest,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "fetched_at": time.time(),
+            })
+
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+        return data
+
+    def get_json(self, url: str, session, **kwargs) -> dict:
+
+        """
+        Fetch `url` with a `requests` session, going through the cache.
+        """
+
+        record = self.lookup(url)
+
+        if record is not None and (self.offline or self.is_fresh(record)):
+            return self.load(record)
+
+        if self.offline:
+            raise OfflineCacheMiss(url)
+
+        response = session.get(url, headers=self.conditional_headers(record), **kwargs)
+
+        if response.status_code == 304 and record is not None:
+            return self.revalidated(record)
+
+        response.raise_for_status()
+
+        return self.store(url, response.content, response.headers)
+
+    def stats(self) -> dict:
+
+        with self._lock:
+
+            self._add_bytes(0)
+
+            return {
+                "entries": len(os.listdir(self._urls)),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _record_path(self, url: str) -> str:
+        return os.path.join(self._urls, f"{_sha256(url.encode('utf-8'))}.json")
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self._objects, digest[:2], f"{digest}.json.gz")
+
+    def _write_record(self, record: dict):
+
+        path = self._record_path(record["url"])
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+
+        os.replace(tmp_path, path)
+
+    def _add_bytes(self, size: int):
+
+        if self._total_bytes is None:
+
+            self._total_bytes = sum(
+                entry.stat().st_size
+                for prefix in os.scandir(self._objects) if prefix.is_dir()
+                for entry in os.scandir(prefix.path) if entry.name.endswith(".json.gz")
+            )
+
+        else:
+            self._total_bytes += size
+
+    def _evict(self):
+
+        records = []
+
+        for entry in os.scandir(self._urls):
+
+            if not entry.name.endswith(".json"):
+                continue
+
+            try:
+                with open(entry.path) as f:
+                    records.append((entry.stat().st_mtime, entry.path, json.load(f)))
+            except (OSError, ValueError):
+                continue
+
+        records.sort(key=lambda item: item[0])
+
+        references = {}
+        for _, _, record in records:
+            references[record["object"]] = references.get(record["object"], 0) + 1
+
+        for _, path, record in records:
+
+            if self._total_bytes <= self.max_bytes:
+                break
+
+            os.remove(path)
+            references[record["object"]] -= 1
+
+            if references[record["object"]] == 0:
+
+                object_path = self._object_path(record["object"])
+
+                try:
+                    size = os.path.getsize(object_path)
+                    os.remove(object_path)
+                    self._total_bytes -= size
+                except OSError:
+                    pass
+
+RESPONSE_CACHE = ResponseCache()
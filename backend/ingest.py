@@ -0,0 +1,246 @@
+from constants import BASE_URL, HEADERS, EMBED_BATCH_SIZE
+from vectorstore import get_vector_store, LocalVectorStore
+from parse import create_document, upsert_documents
+from http_cache import RESPONSE_CACHE
+from db import DB
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import random
+import time
+
+import aiohttp
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class FetchError(Exception):
+    pass
+
+def read_accessions(path: str) -> list:
+
+    """
+    Read accessions from a file, one per line (blank lines and # comments are ignored).
+    """
+
+    with open(path) as f:
+        lines = [line.split("#", 1)[0].strip() for line in f]
+
+    return [line for line in lines if line]
+
+async def fetch_study(session: aiohttp.ClientSession, accession: str, retries: int = 5, backoff: float = 1.0) -> dict:
+
+    """
+    GET a study's JSON through the local response cache, retrying with
+    exponential backoff on 429/5xx and connection errors. The cache's file
+    and gzip work runs in a thread, off the event loop.
+    """
+
+    url = BASE_URL.format(id=accession)
+    record = await asyncio.to_thread(RESPONSE_CACHE.lookup, url)
+
+    if record is not None and (RESPONSE_CACHE.offline or RESPONSE_CACHE.is_fresh(record)):
+        return await asyncio.to_thread(RESPONSE_CACHE.load, record)
+
+    if RESPONSE_CACHE.offline:
+        raise FetchError(f"{accession}: not cached (offline mode)")
+
+    for attempt in range(retries + 1):
+
+        try:
+
+            async with session.get(url, headers=RESPONSE_CACHE.conditional_headers(record)) as response:
+
+                if response.status == 304 and record is not None:
+                    return await asyncio.to_thread(RESPONSE_CACHE.revalidated, record)
+
+                if response.status == 200:
+                    return await asyncio.to_thread(RESPONSE_CACHE.store, url, await response.read(), response.headers)
+
+                if response.status not in RETRY_STATUSES:
+                    raise FetchError(f"{accession}: HTTP {response.status}")
+
+                retry_after = response.headers.get("Retry-After")
+                error = FetchError(f"{accession}: HTTP {response.status}")
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            retry_after = None
+            error = FetchError(f"{accession}: {e}")
+
+        if attempt == retries:
+            raise error
+
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff * 2 ** attempt
+        await asyncio.sleep(delay + random.uniform(0, backoff))
+
+async def ingest(accessions: list, concurrency: int = 8, batch_size: int = EMBED_BATCH_SIZE, retries: int = 5, force: bool = False) -> dict:
+
+    """
+    Ingest many studies with the fetch, parse/write and embed/upsert stages overlapping.
+
+    Up to `concurrency` HTTP requests share one pooled session; parsed documents
+    are embedded and upserted in batches of up to `batch_size`. Bounded queues
+    between the stages keep a slow stage from buffering the whole catalog.
+    """
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    summary = {"ingested": [], "skipped": [], "failed": {}}
+
+    pending = asyncio.Queue()
+    parse_queue = asyncio.Queue(maxsize=concurrency * 2)
+    embed_queue = asyncio.Queue(maxsize=batch_size * 2)
+
+    for accession in accessions:
+        pending.put_nowait(accession)
+
+    async def fetcher(session):
+
+        while True:
+
+            try:
+                accession = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            if not force:
+
+                existing = await loop.run_in_executor(executor, DB.get_document, "Project", accession)
+
+                if existing is not None:
+                    summary["skipped"].append(accession)
+                    continue
+
+            try:
+                data = await fetch_study(session, accession, retries=retries)
+            except FetchError as e:
+                summary["failed"][accession] = str(e)
+                continue
+
+            await parse_queue.put((accession, data))
+
+    async def parser():
+
+        while True:
+
+            item = await parse_queue.get()
+
+            if item is None:
+                return
+
+            accession, data = item
+
+            try:
+                metadata, page_content = await loop.run_in_executor(executor, create_document, data)
+            except Exception as e:
+                summary["failed"][accession] = f"create_document: {e}"
+                continue
+
+            await embed_queue.put((accession, metadata, page_content))
+
+    def embed_and_upsert(batch):
+
+        documents = [(metadata, page_content) for _, metadata, page_content in batch]
+
+        upsert_documents(documents, batch_size=len(documents))
+
+    async def embedder():
+
+        done = False
+
+        while not done:
+
+            batch = []
+            item = await embed_queue.get()
+
+            while item is not None:
+
+                batch.append(item)
+
+                if len(batch) >= batch_size or embed_queue.empty():
+                    break
+
+                item = await embed_queue.get()
+
+            done = item is None
+
+            if not batch:
+                continue
+
+            try:
+                await loop.run_in_executor(executor, embed_and_upsert, batch)
+                summary["ingested"].extend(accession for accession, _, _ in batch)
+            except Exception as e:
+                for accession, _, _ in batch:
+                    summary["failed"][accession] = f"embed/upsert: {e}"
+
+    start = time.perf_counter()
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
+
+        parsers = [asyncio.create_task(parser()) for _ in range(concurrency)]
+        embed_task = asyncio.create_task(embedder())
+
+        await asyncio.gather(*(fetcher(session) for _ in range(concurrency)))
+
+        for _ in parsers:
+            await parse_queue.put(None)
+        await asyncio.gather(*parsers)
+
+        await embed_queue.put(None)
+        await embed_task
+
+    executor.shutdown()
+
+    store = get_vector_store()
+
+    if isinstance(store, LocalVectorStore):
+        store.save()
+
+    summary["seconds"] = time.perf_counter() - start
+
+    return summary
+
+def ingest_accessions(accessions: list, **kwargs) -> dict:
+
+    """
+    Synchronous wrapper around `ingest`.
+    """
+
+    return asyncio.run(ingest(accessions, **kwargs))
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Bulk ingest OSDR studies.")
+    parser.add_argument("accessions", nargs="*", help="Accessions to ingest, e.g. OSD-379")
+    parser.add_argument("--file", help="File with one accession per line")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum in-flight HTTP requests and parse workers")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Documents per embedding/upsert batch")
+    parser.add_argument("--retries", type=int, default=5, help="Retries on 429/5xx responses")
+    parser.add_argument("--force", action="store_true", help="Re-ingest accessions already in Firestore")
+    args = parser.parse_args()
+
+    accessions = list(args.accessions)
+
+    if args.file:
+        accessions += read_accessions(args.file)
+
+    if not accessions:
+        parser.error("no accessions given")
+
+    summary = ingest_accessions(
+        accessions,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        retries=args.retries,
+        force=args.force
+    )
+
+    print(f"Ingested {len(summary['ingested'])}, skipped {len(summary['skipped'])}, failed {len(summary['failed'])} in {summary['seconds']:.1f}s")
+
+    for accession, error in summary["failed"].items():
+        print(f"  {accession}: {error}")
@@ -0,0 +1,280 @@
+from constants import METRICS_ENABLED, METRICS_PREFIX, TRACE_LOG_PATH, LATENCY_BUCKETS
+
+from contextlib import nullcontext
+import contextvars
+import threading
+import functools
+import inspect
+import bisect
+import json
+import time
+import uuid
+
+# Spans of the request being handled, or None outside a trace. Copied into executor threads
+# with contextvars.copy_context, so blocking work done for a request lands in its trace
+_TRACE = contextvars.ContextVar("trace", default=None)
+
+_DISABLED = nullcontext()
+
+class _Span:
+
+    # A plain class rather than @contextmanager: spans wrap hot calls like cached DB reads
+
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics, stage: str):
+
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+
+        self.start = time.perf_counter()
+
+        return self
+
+    def __exit__(self, kind, error, traceback):
+
+        # A generator closed before it was exhausted (e.g. a client leaving a stream) is not an error
+        failed = kind is not None and not issubclass(kind, GeneratorExit)
+        self.metrics.observe(self.stage, time.perf_counter() - self.start, failed, self.start)
+
+        return False
+
+def _labels(labels: dict) -> str:
+
+    if not labels:
+        return ""
+
+    escaped = {key: str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for key, value in labels.items()}
+
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped.items()) + "}"
+
+class Histogram:
+
+    """
+    Cumulative-on-export latency histogram with fixed bucket bounds.
+    """
+
+    def __init__(self, buckets: tuple):
+
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+
+        position = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> tuple:
+
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+class Metrics:
+
+    """
+    Timing spans per pipeline stage, exported in the Prometheus text format.
+
+    Wrap work in `span(stage)` or decorate it with `timed(stage)`. Every span
+    feeds the stage's latency histogram (and its error counter when it
+    raises), and is added to the current trace when a request is being
+    traced; `finish_trace` writes each trace as one JSON line to `trace_path`.
+
+    When disabled, `timed` returns the function it decorates unchanged and
+    `span` returns a shared no-op context manager, so instrumented code costs
+    nothing extra.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, prefix: str = METRICS_PREFIX, trace_path: str = TRACE_LOG_PATH, buckets: tuple = LATENCY_BUCKETS):
+
+        self.enabled = enabled or bool(trace_path)
+        self.prefix = prefix
+        self.trace_path = trace_path
+        self.buckets = tuple(buckets)
+
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._trace_lock = threading.Lock()
+
+    def span(self, stage: str):
+
+        if not self.enabled:
+            return _DISABLED
+
+        return _Span(self, stage)
+
+    def timed(self, stage: str):
+
+        """
+        Decorator timing every call of a function, coroutine function or
+        (async) generator function as a `stage` span. Generators are timed
+        until they are exhausted or closed.
+        """
+
+        def decorator(function):
+
+            if not self.enabled:
+                return function
+
+            if inspect.isasyncgenfunction(function):
+
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    with _Span(self, stage):
+                        async for item in function(*args, **kwargs):
+                            yield item
+
+            elif inspect.iscoroutinefunction(function):
+
+                @functools.wraps(function)
+                async def wrapper(*args, **kwargs):
+                    with _Span(self, stage):
+                        return await function(*args, **kwargs)
+
+            elif inspect.isgeneratorfunction(function):
+
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    with _Span(self, stage):
+                        return (yield from function(*args, **kwargs))
+
+            else:
+
+                @functools.wraps(function)
+                def wrapper(*args, **kwargs):
+                    with _Span(self, stage):
+                        return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def observe(self, stage: str, seconds: float, error: bool = False, start: float = None):
+
+        histogram = self._histograms.get(stage)
+
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram(self.buckets))
+
+        histogram.observe(seconds)
+
+        if error:
+            self.count("stage_errors_total", stage=stage)
+
+        trace = _TRACE.get()
+
+        if trace is not None:
+            trace["spans"].append({
+                "stage": stage,
+                "start": round((start if start is not None else time.perf_counter() - seconds) - trace["started"], 6),
+                "seconds": round(seconds, 6),
+                "error": error,
+            })
+
+    def count(self, name: str, value: int = 1, **labels):
+
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def start_trace(self, **fields):
+
+        """
+        Start collecting the spans of the current request; pass the returned
+        token to `finish_trace`. Returns None when no trace log is configured.
+        """
+
+        if not self.trace_path:
+            return None
+
+        trace = {"trace": uuid.uuid4().hex, **fields, "started": time.perf_counter(), "spans": []}
+
+        return _TRACE.set(trace)
+
+    def finish_trace(self, token, **fields):
+
+        if token is None:
+            return
+
+        trace = _TRACE.get()
+        _TRACE.reset(token)
+
+        trace.update(fields)
+        trace["seconds"] = round(time.perf_counter() - trace.pop("started"), 6)
+
+        line = json.dumps(trace, default=str) + "\n"
+
+        with self._trace_lock:
+            with open(self.trace_path, "a") as f:
+                f.write(line)
+
+    def request_finished(self, route: str, method: str, status: int, seconds: float):
+
+        """
+        Record one served request; shared by the Flask and async servers.
+        """
+
+        if not self.enabled:
+            return
+
+        self.observe(f"http {method} {route}", seconds)
+        self.count("requests_total", route=route, method=method, status=status)
+
+    def render(self) -> str:
+
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+
+        name = f"{self.prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent per pipeline stage, in seconds.",
+            f"# TYPE {name} histogram",
+        ]
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        for stage, histogram in histograms:
+
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_labels({'stage': stage, 'le': bound})} {cumulative}")
+
+            lines.append(f"{name}_sum{_labels({'stage': stage})} {total}")
+            lines.append(f"{name}_count{_labels({'stage': stage})} {count}")
+
+        declared = set()
+
+        for (counter, labels), value in counters:
+
+            full_name = f"{self.prefix}_{counter}"
+
+            if full_name not in declared:
+                lines.append(f"# TYPE {full_name} counter")
+                declared.add(full_name)
+
+            lines.append(f"{full_name}{_labels(dict(labels))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
@@ -1,17 +1,23 @@
-from constants import GROQ_API_KEY, PINECONE_API_KEY, FIREBASE_ID, BASE_URL, BASE_DOCUMENT, EMBEDDINGS, INDEX_NAME, HEADERS
+from constants import BASE_URL, HEADERS, EMBED_BATCH_SIZE
+from embeddings import EMBEDDINGS
+from vectorstore import get_vector_store, LocalVectorStore
+from context_store import CONTEXTS
+from http_cache import RESPONSE_CACHE
+from summary_index import SUMMARIES, build_summary
+from semantic_cache import ANSWER_CACHE
+from chatbot import QUERY_CACHE
+from tables import encode_table, table_writes
+from chunks import split_document
+from render import render_document
+from aggregate import AGGREGATES
+from metrics import METRICS
 from db import DB
 
-import xml.dom.minidom
 import requests
+import time
 
-from langchain_pinecone import PineconeVectorStore
-from langchain.schema import Document
-from pinecone import Pinecone
-from groq import Groq
-
-DB.initialize("../firebase_config.json", FIREBASE_ID)
-pc = Pinecone(api_key=PINECONE_API_KEY)
-groq = Groq(api_key=GROQ_API_KEY)
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
 
 def get_value(data: dict, key: str, default="N/A") -> str:
     
@@ -22,18 +28,18 @@ def get_value(data: dict, key: str, default="N/A") -> str:
     
     return value
 
+@METRICS.timed("osdr.get_json")
 def get_json(id: str) -> dict:
     
     """
-    Retrieve JSON data for a given ID.
+    Retrieve JSON data for a given ID, through the local response cache.
+    Raises `requests.HTTPError` on a non-200 response and `OfflineCacheMiss`
+    for an uncached study in offline mode.
     """
     
     url = BASE_URL.format(id=id)
-    response = requests.get(url, headers=HEADERS)
-    
-    if response.status_code == 200:
-        
-        return response.json()
+
+    return RESPONSE_CACHE.get_json(url, SESSION)
 
 def format_factors(data: dict, document_data: dict) -> list:
     
@@ -41,28 +47,17 @@ def format_factors(data: dict, document_data: dict) -> list:
     Format the 'factors' section of the data.
     """
     
-    document_data["factors"] = []
-    factors = data.get("factors", [])
+    document_data["factors"] = [get_value(factor, "factorName") for factor in data.get("factors", [])]
     
-    text = ""
-    for factor in factors:
-    
-        factor_name = get_value(factor, "factorName")
-        text += f"{factor_name}\n"
-    
-        document_data["factors"].append(factor_name)
-    
-    return text.split()
+    return document_data["factors"]
 
-def format_project(data: dict, document_data: dict) -> list:
+def format_project(data: dict, document_data: dict) -> dict:
     
     """
     Format the 'project' section of the data.
     """
     
-    document_data["project"] = {}
-    
-    project_info = {
+    document_data["project"] = {
         "Project Title": get_value(data, "projectTitle"),
         "Project Type": get_value(data, "projectType"),
         "Flight Program": get_value(data, "flightProgram"),
@@ -72,15 +67,9 @@ def format_project(data: dict, document_data: dict) -> list:
         "Funding Source": get_value(data, "funding"),
     }
     
-    text = ""
-    for key, value in project_info.items():
-    
-        text += f"{key}: {value}\n"
-        document_data["project"][key] = value
-    
-    return text.split()
+    return document_data["project"]
 
-def format_collaborators(data: dict, document_data: dict) -> str:
+def format_collaborators(data: dict, document_data: dict) -> list:
     
     """
     Format the 'collaborators' section of the data.
@@ -89,42 +78,22 @@ def format_collaborators(data: dict, document_data: dict) -> str:
     document_data["collaborators"] = []
     collaborators = data.get("contacts", [])
     
-    collaborators_text = ""
     for collaborator in collaborators:
     
-        first_name = get_value(collaborator, "firstName")
-        last_name = get_value(collaborator, "lastName")
-        email = get_value(collaborator, "email")
-        affiliation = get_value(collaborator, "affiliation")
         roles = collaborator.get("roles", [])
         role = roles[0].get("annotationValue") or "N/A" if roles else "N/A"
 
         document_data["collaborators"].append({
-            "firstName": first_name,
-            "lastName": last_name,
-            "email": email,
-            "affiliation": affiliation,
+            "firstName": get_value(collaborator, "firstName"),
+            "lastName": get_value(collaborator, "lastName"),
+            "email": get_value(collaborator, "email"),
+            "affiliation": get_value(collaborator, "affiliation"),
             "role": role,
         })
 
-        collaborators_text += f"""
-<Name>
-    {first_name} {last_name}
-</Name>
-<Email>
-    {email}
-</Email>
-<Affiliation>
-    {affiliation}
-</Affiliation>
-<Role>
-    {role}
-</Role>
-"""
-
-    return collaborators_text.strip()
-
-def format_payload(data: dict, document_data: dict) -> list:
+    return document_data["collaborators"]
+
+def format_payload(data: dict, document_data: dict) -> dict:
    
     """
     Format the 'payload' section of the data.
@@ -137,71 +106,40 @@ def format_payload(data: dict, document_data: dict) -> list:
         
         payload = payloads[0]
         
-        payload_info = {
+        document_data["payload"] = {
             "identifier": get_value(payload, 'identifier'),
             "name": get_value(payload, 'payloadName'),
             "description": get_value(payload, 'description'),
         }
-        
-        text = ""
-        for key, value in payload_info.items():
-        
-            text += f"{key}: {value}\n"        
-            document_data["payload"][key] = value
 
-        return text.split()
+    return document_data["payload"]
 
-def format_mission(data: dict, document_data: dict) -> list:
+def format_mission(data: dict, document_data: dict) -> dict:
    
     """
     Format the 'mission' section of the data
     """
    
-    document_data["mission"] = {}
-   
-    mission_info = {
+    document_data["mission"] = {
         "name": get_value(data, "missionName"),
         "start": get_value(data, "missionStart"),
         "end": get_value(data, "missionEnd"),
     }
    
-    text = ""
-   
-    for key, value in mission_info.items():
-   
-        text += f"{key}: {value}\n"
-        document_data["mission"][key] = value
-   
-    return text.split()
+    return document_data["mission"]
 
-def format_protocols(data: dict, document_data: dict) -> str:
+def format_protocols(data: dict, document_data: dict) -> list:
     
     """
     Format the 'protocols' section of the data.
     """
     
-    document_data["protocols"] = []
-    protocols = data.get("protocols", [])
-    
-    protocols_text = ""
-    for protocol in protocols:
-    
-        name = get_value(protocol, "name")
-        description = get_value(protocol, "description")
-
-        document_data["protocols"].append({ 
-            "name": name,
-            "description": description 
-        })
-
-        protocols_text += f"""
-<Protocol>
-    <Name>{name}</Name>
-    <Description>{description}</Description>
-</Protocol>
-"""
+    document_data["protocols"] = [
+        {"name": get_value(protocol, "name"), "description": get_value(protocol, "description")}
+        for protocol in data.get("protocols", [])
+    ]
     
-    return protocols_text.strip()
+    return document_data["protocols"]
 
 def get_sample_data(data: dict, accession: str, sample_data: dict):
     
@@ -210,26 +148,7 @@ def get_sample_data(data: dict, accession: str, sample_data: dict):
     
     columns = [h["field"] for h in header]
 
-    rows = list()
-    
-    row_data = dict()
-    for row in table:
-
-        for col, val in row.items():
-        
-            if col in columns:
-            
-                if col != columns[1]:
-            
-                    row_data[col] = val
-            
-                else:
-            
-                    sample_name = val
-        
-        rows.append({sample_name: row_data})
-                    
-    sample_data[accession] = rows
+    sample_data[accession] = encode_table(table, columns, key=columns[1])
     
 def get_assay_data(data: dict, accession: str, assay_data: dict):
     
@@ -238,31 +157,14 @@ def get_assay_data(data: dict, accession: str, assay_data: dict):
     
     columns = [h["field"] for h in header]
 
-    rows = list()
-    
-    row_data = dict()
-    for row in table:
-
-        for col, val in row.items():
-        
-            if col in columns:
-            
-                if col != columns[0]:
-            
-                    row_data[col] = val
-            
-                else:
-            
-                    sample_name = val
-        
-        rows.append({sample_name: row_data})
-                    
-    assay_data[accession] = rows
+    assay_data[accession] = encode_table(table, columns, key=columns[0])
     
+@METRICS.timed("parse.create_document")
 def create_document(data: dict) -> tuple:
     
     """
-    Create the document by populating the BASE_DOCUMENT template with formatted data.
+    Create the study's Firestore documents and render its context document.
+    Returns the vector metadata and the rendered document (see `render.render_document`).
     """
     
     document_data = dict()
@@ -276,19 +178,17 @@ def create_document(data: dict) -> tuple:
     description = get_value(data, "description", "No description available.")
     document_data["description"] = description
 
-    factors = format_factors(data, document_data)
+    format_factors(data, document_data)
     
     organism_links = data.get("organisms", {}).get("links", {})
     organism = next(iter(organism_links.keys()), "N/A")
     document_data["organism"] = organism
 
-    project = format_project(data, document_data)
-    collaborators = format_collaborators(data, document_data)
-    payload = format_payload(data, document_data)
-    mission = format_mission(data, document_data)
-    protocols = format_protocols(data, document_data)
-
-    DB.add_document("Project", document_data, accession)
+    format_project(data, document_data)
+    format_collaborators(data, document_data)
+    format_payload(data, document_data)
+    format_mission(data, document_data)
+    format_protocols(data, document_data)
 
     sample_data = dict()
     assay_data = dict()
@@ -296,48 +196,97 @@ def create_document(data: dict) -> tuple:
     get_sample_data(data, accession, sample_data)
     get_assay_data(data, accession, assay_data)
 
-    DB.add_document("Sample", sample_data, accession)
-    DB.add_document("Assay", assay_data, accession)
-
     metadata = { 
         "project_title": title,
         "accession": accession
     }
 
-    document = BASE_DOCUMENT.format(
-        accession=accession,
-        description=description,
-        factors=factors,
-        organism=organism,
-        project=project,
-        collaborators=collaborators,
-        payload=payload,
-        mission=mission,
-        protocols=protocols,
-    )
-
-    dom = xml.dom.minidom.parseString(document)
-    pretty_document = dom.toprettyxml(indent="\t")
+    pretty_document = render_document(document_data)
+
+    summary = build_summary(document_data, sample_data[accession]["rows"], assay_data[accession]["rows"])
+
+    statuses = DB.write_many([
+        ("set", "Project", accession, document_data),
+        *table_writes("Sample", accession, sample_data[accession]),
+        *table_writes("Assay", accession, assay_data[accession]),
+        ("set", CONTEXTS.collection, accession, CONTEXTS.record(accession, str(pretty_document))),
+        ("set", SUMMARIES.collection, accession, summary),
+    ])
+
+    failed = [status for status in statuses if status["status"] != "ok"]
+
+    if failed:
+        raise RuntimeError(f"Failed to write {accession}: {failed[0]['error']}")
+
+    CONTEXTS.remember(accession, str(pretty_document))
+    SUMMARIES.put(summary, persist=False)
+    ANSWER_CACHE.invalidate_accession(accession)
+    QUERY_CACHE.invalidate_accession(accession)
+    AGGREGATES.invalidate(accession)
 
     return metadata, pretty_document
 
+def upsert_documents(documents: list, batch_size: int = EMBED_BATCH_SIZE) -> list:
+
+    """
+    Split (metadata, page_content) pairs into section chunks, then embed and
+    upsert them, `batch_size` documents per embedding pass. A study's previous
+    vectors are deleted first, so re-ingesting never leaves stale chunks behind.
+    Returns per-batch timings and throughput.
+    """
+
+    store = get_vector_store()
+    batches = []
+
+    for start in range(0, len(documents), batch_size):
+
+        batch = documents[start:start + batch_size]
+        chunks = [chunk for metadata, page_content in batch for chunk in split_document(metadata, page_content)]
+
+        embed_start = time.perf_counter()
+        embeddings = EMBEDDINGS.encode([embedding_text for _, _, _, embedding_text in chunks])
+        upsert_start = time.perf_counter()
+
+        store.delete(filter={"accession": {"$in": [metadata["accession"] for metadata, _ in batch]}})
+
+        store.upsert(
+            ids=[id for id, _, _, _ in chunks],
+            vectors=embeddings,
+            metadatas=[{**metadata, "text": text} for _, metadata, text, _ in chunks]
+        )
+
+        end = time.perf_counter()
+
+        stats = {
+            "documents": len(batch),
+            "chunks": len(chunks),
+            "embed_seconds": upsert_start - embed_start,
+            "upsert_seconds": end - upsert_start,
+            "documents_per_second": len(batch) / max(end - embed_start, 1e-9),
+        }
+        batches.append(stats)
+
+        print(f"Batch {len(batches)}: {stats['documents']} documents ({stats['chunks']} chunks), embed {stats['embed_seconds']:.2f}s, upsert {stats['upsert_seconds']:.2f}s, {stats['documents_per_second']:.1f} docs/s")
+
+    return batches
+
 def add(accession: str):
     
     data = get_json(accession)
 
-    PineconeVectorStore(index_name=INDEX_NAME, embedding=EMBEDDINGS)
     metadata, page_content = create_document(data)
 
-    document = Document(
-        page_content=page_content,
-        metadata=metadata
-    )
+    upsert_documents([(metadata, page_content)])
 
-    PineconeVectorStore.from_documents(
-        [document],
-        EMBEDDINGS,
-        index_name=INDEX_NAME
-    )
+def add_many(accessions: list, batch_size: int = EMBED_BATCH_SIZE) -> list:
+
+    """
+    Create the documents for several accessions, then embed and upsert them in batches.
+    """
+
+    documents = [create_document(get_json(accession)) for accession in accessions]
+
+    return upsert_documents(documents, batch_size)
 
 def search(accession: str):
 
@@ -357,8 +306,14 @@ if __name__ == "__main__":
     
     accessions = ["OSD-665", "OSD-379", "OSD-702", "OSD-678", "OSD-718", "OSD-742", "OSD-516"]
     
-    for accession in accessions:
-        search(accession)
+    missing = [accession for accession in accessions if DB.get_document("Project", accession) is None]
+
+    add_many(missing)
+
+    store = get_vector_store()
+
+    if isinstance(store, LocalVectorStore):
+        store.save()
     
     # response = chatbot("Using direct reports, can you give me some intresting results found from experiments on mice.")
 
@@ -0,0 +1,111 @@
+def escape(value) -> str:
+
+    # Chained replace is several times faster than str.translate for long text
+    return str(value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+class RenderedDocument(str):
+
+    """
+    A rendered study document. Behaves as the XML string; `records` maps each
+    section tag to the `(xml, text)` records written into it, so chunking and
+    embedding can use them without parsing the XML again.
+    """
+
+    records: dict
+
+def render_document(document_data: dict) -> RenderedDocument:
+
+    """
+    Render a study's Project document as tab-indented XML in a single pass.
+
+    Every value is escaped on the way out, so `&` and `<` in descriptions are
+    safe. Parts are appended to a list and joined once at the end, which keeps
+    rendering linear in the size of the document. Alongside the XML, each
+    section's records are kept as escaped XML and as plain text; the plain
+    text is what section chunks are embedded from.
+    """
+
+    parts = ['<?xml version="1.0" ?>\n<CONTENT>\n']
+    write = parts.append
+    records = {}
+
+    def text_element(tag: str, lines: list):
+
+        lines = [str(line) for line in lines if line] or ["N/A"]
+        escaped = [escape(line) for line in lines]
+
+        write(f"\t<{tag}>\n")
+
+        for line in escaped:
+            write(f"\t\t{line}\n")
+
+        write(f"\t</{tag}>\n")
+
+        records[tag] = [("\n".join(escaped), " ".join(lines))]
+
+    def record_element(tag: str, items: list, wrapper: str = None):
+
+        """
+        A section made of records, each a list of (field tag, value) pairs,
+        optionally wrapped in a `wrapper` element.
+        """
+
+        if not items:
+            text_element(tag, [])
+            return
+
+        indent = "\t\t\t" if wrapper else "\t\t"
+        section = []
+
+        write(f"\t<{tag}>\n")
+
+        for fields in items:
+
+            lines = [f"<{field}>{escape(value)}</{field}>" for field, value in fields]
+
+            if wrapper:
+                write(f"\t\t<{wrapper}>\n")
+
+            for line in lines:
+                write(f"{indent}{line}\n")
+
+            if wrapper:
+                write(f"\t\t</{wrapper}>\n")
+                lines = [f"<{wrapper}>", *lines, f"</{wrapper}>"]
+
+            section.append(("\n".join(lines), " ".join(str(value) for _, value in fields)))
+
+        write(f"\t</{tag}>\n")
+
+        records[tag] = section
+
+    text_element("ACCESSION", [document_data.get("accession")])
+    text_element("DESCRIPTION", [document_data.get("description")])
+    text_element("FACTORS", document_data.get("factors", []))
+    text_element("ORGANISM", [document_data.get("organism")])
+    text_element("PROJECT", [f"{key}: {value}" for key, value in document_data.get("project", {}).items()])
+
+    record_element("COLLABORATORS", [
+        [
+            ("Name", f"{collaborator['firstName']} {collaborator['lastName']}"),
+            ("Email", collaborator["email"]),
+            ("Affiliation", collaborator["affiliation"]),
+            ("Role", collaborator["role"]),
+        ]
+        for collaborator in document_data.get("collaborators", [])
+    ])
+
+    text_element("PAYLOAD", [f"{key}: {value}" for key, value in document_data.get("payload", {}).items()])
+    text_element("MISSIONS", [f"{key}: {value}" for key, value in document_data.get("mission", {}).items()])
+
+    record_element("PROTOCOLS", [
+        [("Name", protocol["name"]), ("Description", protocol["description"])]
+        for protocol in document_data.get("protocols", [])
+    ], wrapper="Protocol")
+
+    write("</CONTENT>\n")
+
+    document = RenderedDocument("".join(parts))
+    document.records = records
+
+    return document
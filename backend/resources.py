@@ -0,0 +1,117 @@
+from metrics import METRICS
+
+import threading
+import time
+
+class Resources:
+
+    """
+    Process-wide clients and models, created on first use.
+
+    Modules register a factory per resource at import time, which costs
+    nothing; the heavy import and the connection or model load happen in the
+    factory, the first time `get` is called. `warm` creates resources ahead
+    of time (e.g. at server start), optionally on a background thread so the
+    server can start listening meanwhile.
+    """
+
+    def __init__(self):
+
+        self._factories = {}
+        self._instances = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.load_seconds = {}
+
+    def register(self, name: str, factory):
+
+        """
+        Set the factory of `name`. An instance that was already created (or
+        `set`) is kept; call `reset` first to rebuild it from the new factory.
+        """
+
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+
+    def set(self, name: str, instance):
+
+        """
+        Use `instance` for `name` instead of creating one, e.g. a local fake.
+        """
+
+        with self._lock:
+            self._instances[name] = instance
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str):
+
+        instance = self._instances.get(name)
+
+        if instance is not None:
+            return instance
+
+        lock = self._locks.get(name)
+
+        if lock is None:
+            raise KeyError(f"No resource registered as {name!r}")
+
+        # One lock per resource: loading the model does not hold up the first Firestore call
+        with lock:
+
+            instance = self._instances.get(name)
+
+            if instance is None:
+
+                start = time.perf_counter()
+
+                with METRICS.span(f"resource.{name}"):
+                    instance = self._factories[name]()
+
+                self.load_seconds[name] = time.perf_counter() - start
+                self._instances[name] = instance
+
+        return instance
+
+    def loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def reset(self, name: str = None):
+
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+            else:
+                self._instances.pop(name, None)
+
+    def warm(self, names: list = None, background: bool = False):
+
+        """
+        Create `names` (default: every registered resource) now. In the
+        background, returns the started thread; otherwise returns the seconds
+        each one took to create. Failures are reported and left for `get` to raise.
+        """
+
+        names = list(self._factories) if names is None else list(names)
+
+        if background:
+            thread = threading.Thread(target=self.warm, args=(names,), name="resource-warmup", daemon=True)
+            thread.start()
+            return thread
+
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Could not warm {name}: {e}")
+
+        return {name: self.load_seconds[name] for name in names if name in self.load_seconds}
+
+    def status(self) -> dict:
+
+        return {
+            name: {"loaded": name in self._instances, "seconds": self.load_seconds.get(name)}
+            for name in sorted(set(self._factories) | set(self._instances))
+        }
+
+RESOURCES = Resources()
@@ -0,0 +1,165 @@
+from constants import EMBEDDING_DIM, SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TTL
+
+import threading
+import hashlib
+import time
+
+import numpy as np
+
+def hash_context(messages: list, query: str) -> str:
+
+    """
+    Hash of a prompt without the user's question, which ends the last message.
+    """
+
+    prompt = [message["content"] for message in messages]
+    prompt[-1] = prompt[-1][:len(prompt[-1]) - len(query)]
+
+    return hashlib.sha256("\0".join(prompt).encode("utf-8")).hexdigest()
+
+def normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+class SemanticCache:
+
+    """
+    LLM answer cache keyed by meaning rather than exact text.
+
+    An entry is (query embedding, accession, retrieved context hash) -> answer.
+    A lookup only considers entries with the same accession and context hash,
+    and returns the answer of the most similar cached query if its cosine
+    similarity reaches `threshold`. Embeddings live in one preallocated matrix,
+    so a lookup is a single matrix-vector product over the candidate rows. Full
+    caches evict the least recently used entry; `invalidate_accession` drops
+    everything derived from a study, for when it is re-ingested.
+    """
+
+    def __init__(self, max_size: int = SEMANTIC_CACHE_SIZE, threshold: float = SEMANTIC_CACHE_THRESHOLD, ttl: float = SEMANTIC_CACHE_TTL, dim: int = EMBEDDING_DIM):
+
+        self.max_size = max_size
+        self.threshold = threshold
+        self.ttl = ttl
+
+        self._embeddings = np.zeros((max_size, dim), dtype=np.float32)
+        self._last_used = np.zeros(max_size, dtype=np.float64)
+        self._created = np.zeros(max_size, dtype=np.float64)
+        self._keys = [None] * max_size
+        self._answers = [None] * max_size
+        self._accessions = [frozenset()] * max_size
+
+        self._free = list(range(max_size - 1, -1, -1))
+        self._rows = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+
+    def lookup(self, embedding, accession, context_hash: str):
+
+        query = normalize(embedding)
+
+        with self._lock:
+
+            now = time.time()
+            rows = self._rows.get((accession, context_hash), [])
+
+            if self.ttl:
+                for row in [row for row in rows if now - self._created[row] > self.ttl]:
+                    self._drop(row)
+                rows = self._rows.get((accession, context_hash), [])
+
+            if rows:
+
+                scores = self._embeddings[rows] @ query
+                best = int(np.argmax(scores))
+
+                if scores[best] >= self.threshold:
+
+                    row = rows[best]
+                    self._last_used[row] = now
+                    self.hits += 1
+
+                    return self._answers[row]
+
+            self.misses += 1
+
+            return None
+
+    def store(self, embedding, accession, context_hash: str, answer: str, accessions=()):
+
+        """
+        Cache `answer`; `accessions` lists the studies whose documents were in the context.
+        """
+
+        vector = normalize(embedding)
+
+        with self._lock:
+
+            if not self._free:
+                self._drop(int(np.argmin(self._last_used)))
+                self.evictions += 1
+
+            row = self._free.pop()
+            key = (accession, context_hash)
+            now = time.time()
+
+            self._embeddings[row] = vector
+            self._last_used[row] = now
+            self._created[row] = now
+            self._keys[row] = key
+            self._answers[row] = answer
+            self._accessions[row] = frozenset(accessions) | ({accession} if accession else frozenset())
+            self._rows.setdefault(key, []).append(row)
+
+    def invalidate_accession(self, accession: str) -> int:
+
+        with self._lock:
+
+            rows = [row for row, accessions in enumerate(self._accessions) if self._keys[row] and accession in accessions]
+
+            for row in rows:
+                self._drop(row)
+
+            return len(rows)
+
+    def clear(self):
+
+        with self._lock:
+
+            for row in range(self.max_size):
+                if self._keys[row]:
+                    self._drop(row)
+
+    def stats(self) -> dict:
+
+        with self._lock:
+
+            lookups = self.hits + self.misses
+
+            return {
+                "size": self.max_size - len(self._free),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _drop(self, row: int):
+
+        key = self._keys[row]
+        rows = self._rows[key]
+        rows.remove(row)
+
+        if not rows:
+            del self._rows[key]
+
+        self._keys[row] = None
+        self._answers[row] = None
+        self._accessions[row] = frozenset()
+        self._free.append(row)
+
+ANSWER_CACHE = SemanticCache()
@@ -1,20 +1,39 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from dotenv import load_dotenv
 from flask_cors import CORS
-import os
+import time
+import json
 
-from chatbot import chatbot, chatbot_specific
+from chatbot import chatbot, chatbot_specific, chatbot_stream, chatbot_specific_stream, cache_stats
+from service import initialize, refresh_study, aggregate_args, summary_row, format_table, CORS_ORIGINS, CHAT_ERROR, SUMMARY_FIELDS, MAX_PAGE_SIZE
+from summary_index import SUMMARIES
+from aggregate import AGGREGATES
+from metrics import METRICS
 from db import DB
 
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": ["http://localhost:3000", "http://127.0.0.1:3000"]}})
+CORS(app, resources={r"/api/*": {"origins": CORS_ORIGINS}})
 
 load_dotenv()
 
-FIREBASE_KEY_PATH = "../firebase_config.json"
-FIREBASE_ID = os.getenv("FIREBASE_ID")
+initialize()
 
-DB.initialize(FIREBASE_KEY_PATH, FIREBASE_ID)
+@app.before_request
+def start_request_metrics():
+    g.trace = METRICS.start_trace(method=request.method, path=request.path)
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def finish_request_metrics(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    METRICS.request_finished(route, request.method, response.status_code, time.perf_counter() - g.request_start)
+    METRICS.finish_trace(g.pop('trace', None), route=route, status=response.status_code)
+    return response
+
+@app.teardown_request
+def close_request_trace(error):
+    # after_request is skipped when a handler raises; still write that request's trace
+    METRICS.finish_trace(g.pop('trace', None), status=500)
 
 @app.route('/api/<collection_name>', methods=['POST'])
 def add_document(collection_name):
@@ -23,6 +42,7 @@ def add_document(collection_name):
     if document_data:
         if document_id:
             DB.add_document(collection_name, document_data, document_id)
+            refresh_study(collection_name, document_id)
             return jsonify({'message': f'Document {document_id} added successfully.'}), 201
         else:
             DB.add_document(collection_name, document_data)
@@ -44,6 +64,7 @@ def update_document(collection_name, document_id):
     if updates:
         try:
             DB.update_document(collection_name, document_id, updates)
+            refresh_study(collection_name, document_id)
             return jsonify({'message': f'Document {document_id} updated successfully.'}), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 400
@@ -54,6 +75,7 @@ def update_document(collection_name, document_id):
 def delete_document(collection_name, document_id):
     try:
         DB.delete_document(collection_name, document_id)
+        refresh_study(collection_name, document_id)
         return jsonify({'message': f'Document {document_id} deleted successfully.'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 400
@@ -69,31 +91,134 @@ def query_documents(collection_name):
         return jsonify(results), 200
     else:
         return jsonify({'error': 'Field and value query parameters are required.'}), 400
+
+@app.route('/api/<collection_name>/<document_id>/aggregate', methods=['GET'])
+def aggregate_documents(collection_name, document_id):
+
+    """
+    Value counts or a histogram of one Sample/Assay column, e.g.
+    ?column=Factor Value[Spaceflight] or ?column=Parameter Value[QA Score]&width=0.5&by=Factor Value[Spaceflight]
+    """
+
+    if 'column' not in request.args:
+        return jsonify({'error': 'The column query parameter is required.'}), 400
+
+    try:
+        result = AGGREGATES.aggregate(collection_name, document_id, **aggregate_args(request.args))
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(result), 200
     
+def summary_response():
+
+    """
+    The catalog summary blob, gzip-encoded when accepted, with 304s on a matching ETag.
+    """
+
+    body, compressed, etag = SUMMARIES.blob()
+
+    headers = {
+        'Cache-Control': 'no-cache',
+        'Vary': 'Accept-Encoding',
+    }
+
+    if 'gzip' in request.accept_encodings:
+        headers['Content-Encoding'] = 'gzip'
+        body = compressed
+        etag += '-gzip'
+
+    response = Response(body, mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+
+    return response.make_conditional(request)
+
 @app.route('/api/<collection_name>/all', methods=['GET'])
 def get_all_documents(collection_name):
-    
+
+    """
+    List a collection, projected to `fields` server-side.
+
+    Without `limit` the whole collection is streamed as a JSON array (or as
+    NDJSON with `format=ndjson`) without being held in memory. With `limit`,
+    one page is returned as {"data": [...], "next": cursor}; pass the cursor
+    back as `after` for the following page (NDJSON pages put it in X-Next-Cursor).
+
+    A plain `/api/Project/all` is answered from the in-memory summary index.
+    """
+
+    if collection_name == "Project" and not request.args:
+        return summary_response()
+
+    fields = request.args.get('fields')
+    fields = fields.split(',') if fields else SUMMARY_FIELDS
+    output = request.args.get('format', 'json')
+    after = request.args.get('after')
+    limit = request.args.get('limit', type=int)
+
     try:
-        
-        documents = DB.get_all_documents(collection_name)
 
-        data = list()
-        for document in documents:
+        if limit is not None:
 
-            row = dict()
-            
-            row["accession"] = document["accession"]
-            row["title"] = document["title"]
-            row["organism"] = document["organism"]
-            row["slug"] = document["accession"]
+            limit = max(1, min(limit, MAX_PAGE_SIZE))
+            page = list(DB.stream_documents(collection_name, fields, limit=limit, after=after))
+            rows = [summary_row(document_id, document, fields) for document_id, document in page]
+            next_cursor = page[-1][0] if len(page) == limit else None
 
-            data.append(row)
+            if output == 'ndjson':
+                body = "".join(json.dumps(row) + "\n" for row in rows)
+                headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+                return Response(body, mimetype='application/x-ndjson', headers=headers), 200
+
+            return jsonify({'data': rows, 'next': next_cursor}), 200
+
+        documents = DB.stream_documents(collection_name, fields, after=after)
+
+        # Pull the first document eagerly so query errors still produce a 500
+        first = next(documents, None)
+
+        def rows():
+            if first is not None:
+                yield summary_row(*first, fields)
+            for document_id, document in documents:
+                yield summary_row(document_id, document, fields)
+
+        if output == 'ndjson':
+            return Response((json.dumps(row) + "\n" for row in rows()), mimetype='application/x-ndjson'), 200
+
+        def json_array():
+            yield "["
+            for index, row in enumerate(rows()):
+                yield ("," if index else "") + json.dumps(row)
+            yield "]"
+
+        return Response(json_array(), mimetype='application/json'), 200
 
-        return data, 200
-    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
+def sse_response(tokens):
+
+    """
+    Stream LLM tokens as Server-Sent Events: one `data: {"token": ...}` event per
+    token, then a `done` event, or an `error` event if generation fails midway.
+    """
+
+    def events():
+        try:
+            for token in tokens:
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        except Exception as e:
+            print(f"Error: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': CHAT_ERROR})}\n\n"
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+
 @app.route('/api/chatbot', methods=['POST'])
 def chatbot_api():
     data = request.get_json()
@@ -105,9 +230,16 @@ def chatbot_api():
         bot_response = chatbot(user_input)
     except Exception as e:
         print(f"Error: {e}")
-        return jsonify({'error': 'An error occurred while processing your message.'}), 500
+        return jsonify({'error': CHAT_ERROR}), 500
     return jsonify({'response': bot_response}), 200
 
+@app.route('/api/chatbot/stream', methods=['POST'])
+def chatbot_stream_api():
+    data = request.get_json()
+    if not data or 'message' not in data:
+        return jsonify({'error': 'No message provided'}), 400
+    return sse_response(chatbot_stream(data['message']))
+
 @app.route('/api/chatbot/project', methods=['POST'])
 def chatbot_project_api():
     
@@ -119,21 +251,32 @@ def chatbot_project_api():
     accession = data["accession"]
     query = data["query"]
 
-    table_text = ""
-    for row in table:
-        table_text += f"{row["name"]}: {row["value"]}{"%" if percent else ""}\n"
-    
-    table_text.strip()
-    table_text = "<DATA VISUAL>\n" + table_text + "\n</DATA VISUA>"
+    table_text = format_table(table, percent)
 
     try:
          bot_response = chatbot_specific(query, table_text, accession)
     except Exception as e:
         print(f"Error: {e}")
-        return jsonify({'error': 'An error occurred while processing your message.'}), 500
+        return jsonify({'error': CHAT_ERROR}), 500
     
     return jsonify({'response': bot_response}), 200
 
+@app.route('/api/chatbot/project/stream', methods=['POST'])
+def chatbot_project_stream_api():
+
+    data = request.get_json()
+
+    table_text = format_table(data["data"], data["percent"])
+
+    return sse_response(chatbot_specific_stream(data["query"], table_text, data["accession"]))
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_api():
+    return Response(METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/api/chatbot/stats', methods=['GET'])
+def chatbot_stats_api():
+    return jsonify(cache_stats())
 
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,110 @@
+from constants import DB_CACHE_ENABLED, DB_CACHE_SIZE, DB_CACHE_DEFAULT_TTL, DB_CACHE_TTLS, DB_CACHE_WARM, FIREBASE_KEY_PATH, FIREBASE_ID, WARM_RESOURCES
+from summary_index import SUMMARIES
+from context_store import CONTEXTS
+from semantic_cache import ANSWER_CACHE
+from chatbot import QUERY_CACHE
+from aggregate import AGGREGATES, TABLE_COLLECTIONS
+from resources import RESOURCES
+from db import DB
+
+import threading
+
+CORS_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
+
+CHAT_ERROR = 'An error occurred while processing your message.'
+
+# Fields the HomePage list needs; override with ?fields=a,b,c
+SUMMARY_FIELDS = ["accession", "title", "organism"]
+MAX_PAGE_SIZE = 1000
+
+# Collections whose writes change a study's catalog summary
+SUMMARY_SOURCES = {"Project", "Sample", "Assay"}
+
+# Collections whose writes change the context cached chatbot answers were built from
+ANSWER_SOURCES = {"Project", CONTEXTS.collection}
+
+def initialize(warm_in_background=True):
+
+    """
+    Configure Firestore and the document cache; shared by the Flask and async servers.
+
+    Nothing is connected or loaded here, so the server can start listening at
+    once. The warm-up (see `warm_up`) runs on a background thread, or before
+    returning with `warm_in_background=False`.
+    """
+
+    DB.initialize(FIREBASE_KEY_PATH, FIREBASE_ID)
+
+    if DB_CACHE_ENABLED:
+        DB.enable_cache(max_size=DB_CACHE_SIZE, ttls=DB_CACHE_TTLS, default_ttl=DB_CACHE_DEFAULT_TTL)
+
+    if warm_in_background:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    else:
+        warm_up()
+
+def warm_up():
+
+    """
+    Create the WARM_RESOURCES and fill the document cache. Requests served
+    meanwhile create what they need themselves.
+    """
+
+    RESOURCES.warm(WARM_RESOURCES)
+
+    if DB_CACHE_ENABLED:
+        DB.warm_cache(DB_CACHE_WARM)
+
+def refresh_study(collection_name, document_id):
+
+    """
+    Bring this process's derived state for a study in line after a write through the API.
+    """
+
+    if not document_id:
+        return
+
+    if collection_name in SUMMARY_SOURCES:
+        SUMMARIES.refresh(document_id)
+
+    if collection_name in ANSWER_SOURCES:
+        CONTEXTS.invalidate(document_id)
+        ANSWER_CACHE.invalidate_accession(document_id)
+        QUERY_CACHE.invalidate_accession(document_id)
+
+    if collection_name in TABLE_COLLECTIONS:
+        AGGREGATES.invalidate(document_id)
+
+def aggregate_args(args):
+
+    """
+    Keyword arguments for `AGGREGATES.aggregate` from a request's query string.
+    """
+
+    bins = args.get('bins')
+    width = args.get('width')
+
+    return {
+        "column": args['column'],
+        "by": args.get('by'),
+        "bins": int(bins) if bins else None,
+        "width": float(width) if width else None,
+    }
+
+def summary_row(document_id, document, fields):
+
+    row = {field: document.get(field) for field in fields}
+    row["slug"] = document.get("accession", document_id)
+
+    return row
+
+def format_table(table, percent):
+
+    table_text = ""
+    for row in table:
+        table_text += f"{row["name"]}: {row["value"]}{"%" if percent else ""}\n"
+    
+    table_text.strip()
+    table_text = "<DATA VISUAL>\n" + table_text + "\n</DATA VISUA>"
+
+    return table_text
@@ -0,0 +1,157 @@
+from constants import SUMMARY_COLLECTION, SUMMARY_RELOAD_INTERVAL
+from tables import row_count
+from db import DB
+
+import threading
+import hashlib
+import json
+import gzip
+import time
+
+def build_summary(project: dict, sample_count: int = 0, assay_count: int = 0) -> dict:
+
+    """
+    Compact catalog record for one study, built from its Project document.
+    """
+
+    accession = project.get("accession")
+
+    return {
+        "accession": accession,
+        "slug": accession,
+        "title": project.get("title"),
+        "organism": project.get("organism"),
+        "factors": project.get("factors", []),
+        "mission": project.get("mission", {}).get("name"),
+        "samples": sample_count,
+        "assays": assay_count,
+    }
+
+class SummaryIndex:
+
+    """
+    In-memory catalog of study summaries, served as one pre-serialized blob.
+
+    The records live in the Summary collection, which ingestion and the write
+    routes keep up to date. This process loads them once, and again every
+    `reload_interval` seconds to pick up other writers. Studies stored before
+    the collection existed get their records from `backfill`. The JSON body, its
+    gzip-compressed form and a strong ETag are rebuilt only when a record
+    changes, so serving the catalog costs a dictionary lookup.
+    """
+
+    def __init__(self, collection: str = SUMMARY_COLLECTION, reload_interval: float = SUMMARY_RELOAD_INTERVAL):
+
+        self.collection = collection
+        self.reload_interval = reload_interval
+
+        self._records = None
+        self._loaded_at = 0.0
+        self._blob = None
+        self._lock = threading.Lock()
+
+    def put(self, record: dict, persist: bool = True):
+
+        if persist:
+            DB.add_document(self.collection, record, record["accession"])
+
+        with self._lock:
+
+            if self._records is not None:
+                self._records[record["accession"]] = record
+                self._blob = None
+
+    def remove(self, accession: str, persist: bool = True):
+
+        if persist:
+            DB.delete_document(self.collection, accession)
+
+        with self._lock:
+
+            if self._records is not None and self._records.pop(accession, None) is not None:
+                self._blob = None
+
+    def refresh(self, accession: str):
+
+        """
+        Rebuild a study's record from its current Project/Sample/Assay documents.
+        """
+
+        record = self._build(accession)
+
+        if record is None:
+            self.remove(accession)
+        else:
+            self.put(record)
+
+    def backfill(self) -> list:
+
+        """
+        Build the record of every Project that has none, e.g. studies stored
+        before the Summary collection existed; returns their accessions. Scans
+        the Project collection, so it runs from sync.py, not on the request path.
+        """
+
+        summarized = {accession for accession, _ in DB.stream_documents(self.collection, fields=["accession"])}
+        added = []
+
+        for accession, _ in DB.stream_documents("Project", fields=["accession"]):
+
+            if accession in summarized:
+                continue
+
+            record = self._build(accession)
+
+            if record is not None:
+                self.put(record)
+                added.append(accession)
+
+        return added
+
+    def blob(self) -> tuple:
+
+        """
+        Return `(json_bytes, gzip_bytes, etag)` for the whole catalog.
+        """
+
+        with self._lock:
+
+            if self._records is None or time.monotonic() - self._loaded_at >= self.reload_interval:
+                self._load()
+
+            if self._blob is None:
+
+                records = [self._records[accession] for accession in sorted(self._records)]
+                body = json.dumps(records, separators=(",", ":")).encode("utf-8")
+
+                self._blob = (
+                    body,
+                    gzip.compress(body, mtime=0),
+                    hashlib.sha256(body).hexdigest()[:32],
+                )
+
+            return self._blob
+
+    def _build(self, accession: str):
+
+        project = DB.get_document("Project", accession)
+
+        if project is None:
+            return None
+
+        samples = DB.get_document("Sample", accession)
+        assays = DB.get_document("Assay", accession)
+
+        return build_summary({"accession": accession, **project}, row_count(samples, accession), row_count(assays, accession))
+
+    def _load(self):
+
+        records = {record["accession"]: record for record in DB.get_all_documents(self.collection)}
+
+        if records != self._records:
+            self._blob = None
+
+        self._records = records
+        self._loaded_at = time.monotonic()
+
+SUMMARIES = SummaryIndex()
@@ -0,0 +1,212 @@
+from constants import HEADERS, EMBED_BATCH_SIZE, SYNC_COLLECTION
+from vectorstore import get_vector_store, LocalVectorStore
+from parse import create_document, upsert_documents
+from ingest import fetch_study, read_accessions, FetchError
+from context_store import CONTEXTS
+from summary_index import SUMMARIES
+from semantic_cache import ANSWER_CACHE
+from chatbot import QUERY_CACHE
+from tables import table_deletes
+from aggregate import AGGREGATES
+from db import DB
+
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import hashlib
+import asyncio
+import json
+import time
+import sys
+
+import aiohttp
+
+STUDY_COLLECTIONS = ["Project", CONTEXTS.collection, SUMMARIES.collection]
+TABLE_COLLECTIONS = ["Sample", "Assay"]
+
+def hash_json(data: dict) -> str:
+
+    """
+    Hash of a study's JSON that ignores key order and whitespace.
+    """
+
+    normalized = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def remove_study(accession: str):
+
+    """
+    Delete a withdrawn study's vectors, Firestore documents and sync record.
+    """
+
+    # The id alone covers studies indexed as one vector, before section chunks
+    get_vector_store().delete(ids=[accession], filter={"accession": accession})
+
+    operations = [("delete", collection, accession, None) for collection in STUDY_COLLECTIONS + [SYNC_COLLECTION]]
+
+    for collection in TABLE_COLLECTIONS:
+        operations += table_deletes(collection, accession)
+
+    DB.write_many(operations)
+
+    CONTEXTS.invalidate(accession)
+    SUMMARIES.remove(accession, persist=False)
+    ANSWER_CACHE.invalidate_accession(accession)
+    QUERY_CACHE.invalidate_accession(accession)
+    AGGREGATES.invalidate(accession)
+
+async def sync(accessions: list, concurrency: int = 8, batch_size: int = EMBED_BATCH_SIZE, retries: int = 5, prune: bool = False) -> dict:
+
+    """
+    Bring Firestore and the vector store in line with the upstream catalog.
+
+    Each study's normalized JSON hash is compared with the one recorded in the
+    Sync collection; unchanged studies cost one HTTP request and nothing else.
+    Changed studies are re-written, and only re-embedded when their rendered
+    document hash changed too. With `prune`, recorded accessions missing from
+    `accessions` are treated as withdrawn and removed.
+    """
+
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    manifest = {record["accession"]: record for record in DB.get_all_documents(SYNC_COLLECTION)}
+
+    summary = {"added": [], "updated": [], "unchanged": [], "removed": [], "failed": {}}
+    records = {}
+    to_embed = []
+
+    async def check(session, accession):
+
+        try:
+            async with semaphore:
+                data = await fetch_study(session, accession, retries=retries)
+        except FetchError as e:
+            summary["failed"][accession] = str(e)
+            return
+
+        data_hash = hash_json(data)
+        record = manifest.get(accession)
+
+        if record is not None and record["data_hash"] == data_hash:
+            summary["unchanged"].append(accession)
+            return
+
+        try:
+            metadata, page_content = await loop.run_in_executor(executor, create_document, data)
+        except Exception as e:
+            summary["failed"][accession] = f"create_document: {e}"
+            return
+
+        document_hash = hash_text(page_content)
+
+        if record is None or record["document_hash"] != document_hash:
+            to_embed.append((metadata, page_content))
+
+        records[accession] = {
+            "accession": accession,
+            "data_hash": data_hash,
+            "document_hash": document_hash,
+        }
+
+        summary["updated" if record is not None else "added"].append(accession)
+
+    start = time.perf_counter()
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(check(session, accession) for accession in accessions))
+
+    if to_embed:
+        await loop.run_in_executor(executor, upsert_documents, to_embed, batch_size)
+
+    # Records are only written once the vectors are in, so an interrupted sync retries the study.
+    for record in records.values():
+        record["synced_at"] = time.time()
+
+    if records:
+        await loop.run_in_executor(executor, DB.add_documents_bulk, SYNC_COLLECTION, records)
+
+    # Studies written before the Summary collection existed, which a sync finds unchanged
+    summary["summaries_backfilled"] = await loop.run_in_executor(executor, SUMMARIES.backfill)
+
+    if prune:
+
+        withdrawn = set(manifest) - set(accessions)
+
+        for accession in sorted(withdrawn):
+            await loop.run_in_executor(executor, remove_study, accession)
+            summary["removed"].append(accession)
+
+    executor.shutdown()
+
+    store = get_vector_store()
+
+    if isinstance(store, LocalVectorStore):
+        store.save()
+
+    summary["embedded"] = len(to_embed)
+    summary["seconds"] = time.perf_counter() - start
+
+    return summary
+
+def sync_accessions(accessions: list, **kwargs) -> dict:
+
+    """
+    Synchronous wrapper around `sync`.
+    """
+
+    return asyncio.run(sync(accessions, **kwargs))
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Incrementally re-sync OSDR studies.")
+    parser.add_argument("accessions", nargs="*", help="Accessions in the catalog, e.g. OSD-379")
+    parser.add_argument("--file", help="File with one accession per line")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum in-flight HTTP requests")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Documents per embedding/upsert batch")
+    parser.add_argument("--retries", type=int, default=5, help="Retries on 429/5xx responses")
+    parser.add_argument("--prune", action="store_true", help="Remove synced studies that are not in the given catalog")
+    parser.add_argument("--backfill-summaries", action="store_true", help="Only build the missing catalog summaries of stored studies")
+    args = parser.parse_args()
+
+    if args.backfill_summaries:
+
+        added = SUMMARIES.backfill()
+        print(f"Built {len(added)} missing summaries")
+
+        for accession in added:
+            print(f"  {accession}")
+
+        sys.exit(0)
+
+    accessions = list(args.accessions)
+
+    if args.file:
+        accessions += read_accessions(args.file)
+
+    if not accessions:
+        parser.error("no accessions given")
+
+    summary = sync_accessions(
+        accessions,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        retries=args.retries,
+        prune=args.prune
+    )
+
+    print(
+        f"Added {len(summary['added'])}, updated {len(summary['updated'])}, unchanged {len(summary['unchanged'])}, "
+        f"removed {len(summary['removed'])}, failed {len(summary['failed'])}; "
+        f"re-embedded {summary['embedded']}, backfilled {len(summary['summaries_backfilled'])} summaries in {summary['seconds']:.1f}s"
+    )
+
+    for accession, error in summary["failed"].items():
+        print(f"  {accession}: {error}")
@@ -0,0 +1,307 @@
+from constants import TABLE_CHUNK_BYTES, TABLE_CATEGORY_RATIO
+from db import DB
+
+import json
+import math
+
+TABLE_FORMAT = "columnar-1"
+
+def chunk_collection(collection: str) -> str:
+    return f"{collection}Chunks"
+
+def chunk_id(accession: str, chunk: int) -> str:
+    return f"{accession}.{chunk}"
+
+def to_number(value):
+
+    """
+    `value` as an int or float, or None if it is not a finite number.
+    """
+
+    if isinstance(value, bool):
+        return None
+
+    if isinstance(value, (int, float)):
+        return value if math.isfinite(value) else None
+
+    if not isinstance(value, str):
+        return None
+
+    for parse in (int, float):
+
+        try:
+            number = parse(value)
+        except ValueError:
+            continue
+
+        return number if math.isfinite(number) else None
+
+    return None
+
+def encode_column(values: list) -> dict:
+
+    """
+    Typed encoding of one column: numbers as a number array, repetitive values
+    as a dictionary plus integer codes, anything else as a plain value array.
+    A number column whose text would not come back from the numbers (e.g.
+    "23.10" or "1e3") also keeps the original values under "text".
+    """
+
+    numbers = [None if value is None or value == "" else to_number(value) for value in values]
+
+    if any(number is not None for number in numbers) and all(number is not None or value is None or value == "" for number, value in zip(numbers, values)):
+
+        column = {"type": "number", "values": numbers}
+
+        if any(isinstance(value, str) and str(number) != value for number, value in zip(numbers, values) if number is not None):
+            column["text"] = values
+
+        return column
+
+    dictionary = {}
+    codes = [dictionary.setdefault(value, len(dictionary)) for value in values]
+
+    if len(dictionary) <= max(1, TABLE_CATEGORY_RATIO * len(values)):
+        return {"type": "category", "dictionary": list(dictionary), "codes": codes}
+
+    return {"type": "string", "values": values}
+
+def decode_column(column: dict) -> list:
+
+    if column["type"] == "category":
+        dictionary = column["dictionary"]
+        return [dictionary[code] for code in column["codes"]]
+
+    return column.get("text", column["values"])
+
+def encode_table(table: list, columns: list, key: str) -> dict:
+
+    """
+    Columnar form of an OSDR table (a list of row dicts). `key` is the column
+    identifying each row, e.g. the sample name; it becomes the table's index.
+    """
+
+    value_columns = [column for column in columns if column != key]
+
+    return {
+        "format": TABLE_FORMAT,
+        "key": key,
+        "rows": len(table),
+        "index": [row.get(key) for row in table],
+        "columns": value_columns,
+        "data": {column: encode_column([row.get(column) for row in table]) for column in value_columns},
+    }
+
+def slice_column(encoded: dict, start: int, end: int) -> dict:
+
+    """
+    Rows `start` to `end` of an encoded column, in the same encoding.
+    """
+
+    return {key: value[start:end] if key in ("values", "text", "codes") else value for key, value in encoded.items()}
+
+def split_column(column: str, encoded: dict, rows: int, budget: int) -> list:
+
+    """
+    `[(start, end, part)]` row ranges of `encoded` whose JSON fits in `budget` bytes each.
+    """
+
+    parts = max(2, math.ceil(len(json.dumps(encoded)) / budget))
+
+    while True:
+
+        step = math.ceil(rows / parts)
+        pieces = [(start, min(start + step, rows), slice_column(encoded, start, start + step)) for start in range(0, rows, step)]
+
+        if all(len(json.dumps(part)) <= budget for _, _, part in pieces):
+            return pieces
+
+        if step == 1:
+            raise ValueError(f"Column {column!r} does not fit in {budget} bytes even one row per chunk")
+
+        parts *= 2
+
+def table_writes(collection: str, accession: str, table: dict, chunk_bytes: int = TABLE_CHUNK_BYTES) -> list:
+
+    """
+    `DB.write_many` operations storing `table` under `accession`.
+
+    Columns are packed into the head document until it reaches `chunk_bytes`
+    of JSON; the rest go to numbered chunk documents in `<collection>Chunks`,
+    and the head records which chunk holds each column. A column too large
+    for one chunk is split by row range over several, recorded as
+    `[[chunk, start, end], ...]`. Chunks left over from a previous, larger
+    version of the table are deleted. Firestore's limit is 1 MiB per
+    document, so the default leaves room for its own overhead.
+    """
+
+    head = {key: value for key, value in table.items() if key != "data"}
+    head["accession"] = accession
+    head["data"] = {}
+    head["chunks"] = {}
+
+    chunks = []
+    size = len(json.dumps(head))
+
+    if size > chunk_bytes:
+        raise ValueError(f"The index of {collection} table {accession} alone is larger than {chunk_bytes} bytes")
+
+    budget = chunk_bytes - len(json.dumps({"accession": accession, "data": {}}))
+
+    for column in table["columns"]:
+
+        encoded = table["data"][column]
+        column_size = len(json.dumps(encoded)) + len(json.dumps(column))
+
+        if not chunks and size + column_size <= chunk_bytes:
+            head["data"][column] = encoded
+            size += column_size
+            continue
+
+        if column_size > budget:
+
+            head["chunks"][column] = []
+
+            for start, end, part in split_column(column, encoded, table["rows"], budget - len(json.dumps(column))):
+                chunks.append(({column: part}, len(json.dumps(part)) + len(json.dumps(column))))
+                head["chunks"][column].append([len(chunks), start, end])
+
+            continue
+
+        if not chunks or chunks[-1][1] + column_size > budget:
+            chunks.append(({}, 0))
+
+        data, chunk_size = chunks[-1]
+        data[column] = encoded
+        chunks[-1] = (data, chunk_size + column_size)
+        head["chunks"][column] = len(chunks)
+
+    head["chunk_count"] = len(chunks)
+
+    previous = DB.get_document(collection, accession) or {}
+    operations = [("set", collection, accession, head)]
+
+    for number, (data, _) in enumerate(chunks, start=1):
+        operations.append(("set", chunk_collection(collection), chunk_id(accession, number), {"accession": accession, "data": data}))
+
+    for number in range(len(chunks) + 1, previous.get("chunk_count", 0) + 1):
+        operations.append(("delete", chunk_collection(collection), chunk_id(accession, number), None))
+
+    return operations
+
+def table_deletes(collection: str, accession: str) -> list:
+
+    """
+    `DB.write_many` operations deleting a stored table and all of its chunks.
+    """
+
+    head = DB.get_document(collection, accession) or {}
+
+    operations = [("delete", collection, accession, None)]
+
+    for number in range(1, head.get("chunk_count", 0) + 1):
+        operations.append(("delete", chunk_collection(collection), chunk_id(accession, number), None))
+
+    return operations
+
+def read_table(collection: str, accession: str, columns: list = None) -> dict:
+
+    """
+    Load a stored table as `{"index": [...], "columns": {name: [values]}}`,
+    fetching only the chunk documents that hold the requested `columns`
+    (all columns when None). Returns None if the study has no table. The
+    lists can be those of the cached documents; treat them as read-only.
+    """
+
+    head = DB.get_document(collection, accession)
+
+    if head is None:
+        return None
+
+    if head.get("format") != TABLE_FORMAT:
+        return read_legacy_table(head, accession, columns)
+
+    wanted = head["columns"] if columns is None else [column for column in columns if column in head["chunks"] or column in head["data"]]
+    locations = {column: head["chunks"][column] for column in wanted if column in head["chunks"]}
+    numbers = set()
+
+    for location in locations.values():
+        numbers.update([part[0] for part in location] if isinstance(location, list) else [location])
+
+    chunks = {}
+
+    for number in sorted(numbers):
+
+        chunk = DB.get_document(chunk_collection(collection), chunk_id(accession, number))
+
+        if chunk is None:
+            raise RuntimeError(f"Missing chunk {number} of {collection} table {accession}")
+
+        chunks[number] = chunk["data"]
+
+    decoded = {}
+
+    for column in wanted:
+
+        location = locations.get(column)
+
+        if location is None:
+            decoded[column] = decode_column(head["data"][column])
+        elif isinstance(location, list):
+            # Split by row range; the parts are listed in row order
+            decoded[column] = [value for number, _, _ in location for value in decode_column(chunks[number][column])]
+        else:
+            decoded[column] = decode_column(chunks[location][column])
+
+    return {
+        "key": head["key"],
+        "index": head["index"],
+        "columns": decoded,
+    }
+
+def read_legacy_table(document: dict, accession: str, columns: list = None) -> dict:
+
+    """
+    `read_table` for documents written before the columnar format: `{accession: [{name: row}]}`.
+    """
+
+    rows = document.get(accession, [])
+    index = [next(iter(row)) for row in rows]
+    values = [next(iter(row.values())) for row in rows]
+
+    if columns is None:
+        columns = list(dict.fromkeys(column for row in values for column in row))
+
+    return {
+        "key": None,
+        "index": index,
+        "columns": {column: [row.get(column) for row in values] for column in columns},
+    }
+
+def row_count(document: dict, accession: str) -> int:
+
+    """
+    Number of rows in a stored table's head document, in either format.
+    """
+
+    if document is None:
+        return 0
+
+    if document.get("format") == TABLE_FORMAT:
+        return document["rows"]
+
+    return len(document.get(accession, []))
+
+def table_rows(table: dict) -> list:
+
+    """
+    Row dicts with the index under the table's key column, for callers that want the table row by row.
+    """
+
+    key = table["key"] or "name"
+    columns = table["columns"]
+
+    return [
+        {key: name, **{column: values[position] for column, values in columns.items()}}
+        for position, name in enumerate(table["index"])
+    ]
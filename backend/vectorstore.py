@@ -0,0 +1,394 @@
+from constants import PINECONE_API_KEY, INDEX_NAME, EMBEDDING_DIM, VECTOR_STORE, LOCAL_INDEX_PATH, LOCAL_INDEX_IVF_THRESHOLD, UPSERT_CHUNK_SIZE, UPSERT_WORKERS, PINECONE_POOL_THREADS
+from resources import RESOURCES
+from metrics import METRICS
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import json
+import os
+
+import numpy as np
+
+class VectorStore:
+
+    """
+    Minimal interface shared by the hosted Pinecone index and the local NumPy index.
+
+    Matches are returned as plain dicts: {"id": ..., "score": ..., "metadata": {...}}.
+    Filters use the Pinecone syntax for equality: {"accession": "OSD-379"},
+    {"accession": {"$eq": "OSD-379"}} or {"accession": {"$in": ["OSD-379", "OSD-665"]}}.
+    """
+
+    def upsert(self, ids: list, vectors, metadatas: list):
+        raise NotImplementedError
+
+    def query(self, vector, top_k: int = 3, filter: dict = None) -> list:
+        raise NotImplementedError
+
+    def delete(self, ids: list = None, filter: dict = None):
+        raise NotImplementedError
+
+class PineconeStore(VectorStore):
+
+    def __init__(self, index_name: str = INDEX_NAME, api_key: str = PINECONE_API_KEY, chunk_size: int = UPSERT_CHUNK_SIZE, workers: int = UPSERT_WORKERS):
+
+        from pinecone import Pinecone
+
+        # One client for the process; its connection pool is shared by every query and upsert
+        self.index = Pinecone(api_key=api_key, pool_threads=PINECONE_POOL_THREADS).Index(index_name)
+        self.chunk_size = chunk_size
+        self.workers = workers
+
+    @METRICS.timed("vector.upsert")
+    def upsert(self, ids: list, vectors, metadatas: list):
+
+        """
+        Upsert in requests of `chunk_size` vectors, sending up to `workers` requests at once.
+        """
+
+        records = [
+            {"id": id, "values": np.asarray(vector).tolist(), "metadata": metadata}
+            for id, vector, metadata in zip(ids, vectors, metadatas)
+        ]
+
+        chunks = [records[start:start + self.chunk_size] for start in range(0, len(records), self.chunk_size)]
+
+        if len(chunks) <= 1 or self.workers <= 1:
+            for chunk in chunks:
+                self.index.upsert(vectors=chunk)
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(chunks))) as executor:
+            list(executor.map(lambda chunk: self.index.upsert(vectors=chunk), chunks))
+
+    @METRICS.timed("vector.query")
+    def query(self, vector, top_k: int = 3, filter: dict = None) -> list:
+
+        response = self.index.query(
+            vector=np.asarray(vector).tolist(),
+            top_k=top_k,
+            filter=filter,
+            include_metadata=True
+        )
+
+        return [
+            {"id": item['id'], "score": item['score'], "metadata": dict(item['metadata'])}
+            for item in response['matches']
+        ]
+
+    @METRICS.timed("vector.delete")
+    def delete(self, ids: list = None, filter: dict = None):
+
+        if ids:
+            self.index.delete(ids=ids)
+
+        if filter:
+            self.index.delete(filter=filter)
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+    return vectors / np.maximum(norms, 1e-12)
+
+def _filter_values(condition) -> set:
+
+    if isinstance(condition, dict):
+
+        if "$eq" in condition:
+            return {condition["$eq"]}
+
+        if "$in" in condition:
+            return set(condition["$in"])
+
+        raise ValueError(f"Unsupported filter operator: {condition}")
+
+    return {condition}
+
+class LocalVectorStore(VectorStore):
+
+    """
+    In-process cosine-similarity index backed by NumPy.
+
+    Search is exact (a single matrix-vector product over all live rows) until
+    `build_ivf` is called, after which queries only scan the `nprobe` clusters
+    closest to the query. Rows can be restricted by metadata equality; an
+    inverted index on `accession` makes per-study filters O(1).
+
+    `save` writes `vectors.npy`, `metadata.json` and (if built) `ivf.npz` under
+    `path`, building the IVF lists first once the index holds `ivf_threshold`
+    vectors; `load` memory-maps the vectors, so opening a large index is
+    instant and pages are only read as they are scanned.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, path: str = None, nprobe: int = 4, ivf_threshold: int = None):
+
+        self.dim = dim
+        self.path = path
+        self.nprobe = nprobe
+        self.ivf_threshold = ivf_threshold
+
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._count = 0
+        self._ids = []
+        self._metadata = []
+        self._live = np.zeros(0, dtype=bool)
+        self._positions = {}
+        self._accessions = {}
+
+        self._centroids = None
+        self._assignments = None
+
+        self._lock = threading.RLock()
+
+        if path and os.path.exists(os.path.join(path, "vectors.npy")):
+            self.load()
+
+    def __len__(self):
+        return len(self._positions)
+
+    @METRICS.timed("vector.upsert")
+    def upsert(self, ids: list, vectors, metadatas: list):
+
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+
+        with self._lock:
+
+            self._reserve(self._count + len(ids))
+
+            for id, vector, metadata in zip(ids, vectors, metadatas):
+
+                if id in self._positions:
+                    self._remove(id)
+
+                row = self._count
+                self._count += 1
+
+                self._vectors[row] = vector
+                self._live[row] = True
+                self._ids.append(id)
+                self._metadata.append(dict(metadata))
+                self._positions[id] = row
+                self._accessions.setdefault(metadata.get("accession"), set()).add(row)
+
+            # New rows are not assigned to any cluster; fall back to exact search.
+            self._centroids = None
+            self._assignments = None
+
+    @METRICS.timed("vector.delete")
+    def delete(self, ids: list = None, filter: dict = None):
+
+        with self._lock:
+
+            for id in ids or []:
+                self._remove(id)
+
+            if filter:
+                for row in self._filter_rows(filter):
+                    self._remove(self._ids[row])
+
+    @METRICS.timed("vector.query")
+    def query(self, vector, top_k: int = 3, filter: dict = None) -> list:
+
+        query = _normalize(np.asarray(vector, dtype=np.float32).reshape(self.dim))
+
+        with self._lock:
+
+            if filter:
+                rows = np.fromiter(self._filter_rows(filter), dtype=np.int64)
+            elif self._centroids is not None:
+                rows = self._probe(query)
+            else:
+                rows = np.flatnonzero(self._live[:self._count])
+
+            if len(rows) == 0:
+                return []
+
+            scores = self._vectors[rows] @ query
+
+            k = min(top_k, len(rows))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+
+            return [
+                {"id": self._ids[rows[i]], "score": float(scores[i]), "metadata": self._metadata[rows[i]]}
+                for i in best
+            ]
+
+    def build_ivf(self, n_lists: int = None, iterations: int = 10, seed: int = 0):
+
+        """
+        Cluster the live vectors with k-means so queries only scan the closest lists.
+        """
+
+        with self._lock:
+
+            rows = np.flatnonzero(self._live[:self._count])
+
+            if len(rows) == 0:
+                return
+
+            n_lists = n_lists or max(1, int(np.sqrt(len(rows))))
+            n_lists = min(n_lists, len(rows))
+
+            data = self._vectors[rows]
+            rng = np.random.default_rng(seed)
+            centroids = data[rng.choice(len(rows), n_lists, replace=False)].copy()
+
+            for _ in range(iterations):
+
+                labels = np.argmax(data @ centroids.T, axis=1)
+
+                for cluster in range(n_lists):
+
+                    members = data[labels == cluster]
+
+                    if len(members):
+                        centroids[cluster] = members.mean(axis=0)
+
+                centroids = _normalize(centroids)
+
+            assignments = np.full(self._count, -1, dtype=np.int32)
+            assignments[rows] = np.argmax(data @ centroids.T, axis=1)
+
+            self._centroids = centroids
+            self._assignments = assignments
+
+    def save(self, path: str = None):
+
+        """
+        Write a compacted copy of the index (deleted rows dropped) to `path`.
+        """
+
+        path = path or self.path
+
+        if not path:
+            return
+
+        os.makedirs(path, exist_ok=True)
+
+        with self._lock:
+
+            if self._centroids is None and self.ivf_threshold and len(self) >= self.ivf_threshold:
+                self.build_ivf()
+
+            rows = np.flatnonzero(self._live[:self._count])
+
+            np.save(os.path.join(path, "vectors.npy"), self._vectors[rows])
+
+            with open(os.path.join(path, "metadata.json"), "w") as f:
+                json.dump({
+                    "dim": self.dim,
+                    "ids": [self._ids[row] for row in rows],
+                    "metadata": [self._metadata[row] for row in rows],
+                }, f)
+
+            ivf_path = os.path.join(path, "ivf.npz")
+
+            if self._centroids is not None:
+                np.savez(ivf_path, centroids=self._centroids, assignments=self._assignments[rows])
+            elif os.path.exists(ivf_path):
+                os.remove(ivf_path)
+
+    def load(self, path: str = None):
+
+        path = path or self.path
+
+        with open(os.path.join(path, "metadata.json")) as f:
+            stored = json.load(f)
+
+        with self._lock:
+
+            self.dim = stored["dim"]
+            self._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            self._count = len(stored["ids"])
+            self._ids = stored["ids"]
+            self._metadata = stored["metadata"]
+            self._live = np.ones(self._count, dtype=bool)
+            self._positions = {id: row for row, id in enumerate(self._ids)}
+            self._accessions = {}
+
+            for row, metadata in enumerate(self._metadata):
+                self._accessions.setdefault(metadata.get("accession"), set()).add(row)
+
+            ivf_path = os.path.join(path, "ivf.npz")
+
+            if os.path.exists(ivf_path):
+                ivf = np.load(ivf_path)
+                self._centroids = ivf["centroids"]
+                self._assignments = ivf["assignments"]
+            else:
+                self._centroids = None
+                self._assignments = None
+
+    def _reserve(self, size: int):
+
+        capacity = len(self._vectors)
+
+        if size <= capacity and isinstance(self._vectors, np.ndarray) and not isinstance(self._vectors, np.memmap):
+            return
+
+        capacity = max(size, 2 * capacity, 64)
+
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:self._count] = self._vectors[:self._count]
+
+        live = np.zeros(capacity, dtype=bool)
+        live[:self._count] = self._live[:self._count]
+
+        self._vectors = vectors
+        self._live = live
+
+    def _remove(self, id):
+
+        row = self._positions.pop(id, None)
+
+        if row is None:
+            return
+
+        self._live[row] = False
+        self._accessions.get(self._metadata[row].get("accession"), set()).discard(row)
+
+    def _filter_rows(self, filter: dict) -> list:
+
+        rows = None
+
+        for key, condition in filter.items():
+
+            values = _filter_values(condition)
+
+            if key == "accession":
+                matched = set().union(*(self._accessions.get(value, set()) for value in values))
+            else:
+                matched = {
+                    row for row in np.flatnonzero(self._live[:self._count])
+                    if self._metadata[row].get(key) in values
+                }
+
+            rows = matched if rows is None else rows & matched
+
+        return sorted(row for row in rows or () if self._live[row])
+
+    def _probe(self, query: np.ndarray) -> np.ndarray:
+
+        nprobe = min(self.nprobe, len(self._centroids))
+        closest = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+
+        return np.flatnonzero(np.isin(self._assignments, closest) & self._live[:self._count])
+
+def create_vector_store() -> VectorStore:
+
+    if VECTOR_STORE == "local":
+        return LocalVectorStore(path=LOCAL_INDEX_PATH, ivf_threshold=LOCAL_INDEX_IVF_THRESHOLD)
+
+    return PineconeStore()
+
+RESOURCES.register("vector_store", create_vector_store)
+
+def get_vector_store() -> VectorStore:
+
+    """
+    Return the process-wide vector store selected by the VECTOR_STORE setting.
+    """
+
+    return RESOURCES.get("vector_store")
@@ -3,22 +3,69 @@ from dash import dcc
 from dash import html
 from dash.dependencies import Input, Output, State, ALL
 import pandas as pd
-from dash.dependencies import Input, Output
 import plotly.express as px
-import math
+import plotly.graph_objects as go
+import os
 
+from datavis_data import STUDIES
 
-data = pd.read_csv('OSD-379/metadata/a_OSD-379_transcription-profiling_rna-sequencing-(rna-seq)_Illumina NovaSeq.txt', sep='\t', index_col=False)
-data2 = pd.read_csv('OSD-379/metadata/s_OSD-379.txt', sep='\t', index_col=False)
-data2.columns = data2.columns.str.strip()
+# Study shown first; any study under DATAVIS_DATA_DIR can be picked from the dropdown
+DEFAULT_STUDY = os.getenv("DATAVIS_STUDY", "OSD-379")
+
+# Histogram bin width, shared by the figures and the click handler
+BIN_WIDTH = 1.0
+
+# Assay columns shown by display_sample_info; clicks only send these to the browser
+SAMPLE_INFO_FIELDS = [
+    'Sample Name',
+    'Parameter Value[QA Instrument]',
+    'Protocol REF',
+    'Unit',
+    'Term Source REF',
+    'Term Accession Number',
+    'Extract Name',
+    'Parameter Value[Spike-in Quality Control]',
+    'Parameter Value[Spike-in Mix Number]',
+    'Parameter Value[library selection]',
+    'Parameter Value[library layout]',
+    'Parameter Value[stranded]',
+    'Parameter Value[rRNA Contamination]',
+]
+
+# Most samples listed for a clicked bin; a sample's details are looked up when it is clicked
+SAMPLE_LIST_LIMIT = 200
+
+# Pie slices shown before the rest are grouped as "Other"
+MAX_PIE_SLICES = 12
 
 # Initialize the Dash app with suppress_callback_exceptions
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 
 # Function to create graphs
-def create_pie_chart(df, column, title):
+def empty_figure(title):
+    fig = go.Figure()
+    fig.update_layout(title=f"{title} (not available for this study)")
+    return fig
+
+
+def create_pie_chart(data, column, title):
+    if column not in data.samples.columns:
+        return empty_figure(title)
+
+    # Figures are built once per study and chart; they only hold counts, never per-sample rows
+    return data.cached(("pie", column, title), lambda: build_pie_chart(data.samples, column, title))
+
+
+def build_pie_chart(df, column, title):
     # Group by the categorical column and count occurrences
-    category_counts = df[column].value_counts().reset_index()
+    category_counts = df[column].value_counts()
+
+    # Keep the figure a fixed size however many distinct values the column has
+    if len(category_counts) > MAX_PIE_SLICES:
+        other = category_counts.iloc[MAX_PIE_SLICES - 1:].sum()
+        category_counts = pd.concat([category_counts.iloc[:MAX_PIE_SLICES - 1], pd.Series({'Other': other})])
+
+    category_counts = category_counts.reset_index()
     category_counts.columns = [column, 'Count']  # Rename columns for clarity
 
     # Create the pie chart using Plotly
@@ -29,22 +76,27 @@ def create_pie_chart(df, column, title):
     return fig
 
 
-def create_histogram(df, x_column, title):
-    # Create histogram using Plotly
-    print([col for col in data2.columns if x_column in col])
-    x_min = data[x_column].min()
-    x_max = data[x_column].max()
-    bin_start = math.floor(x_min)
-    bin_end = math.ceil(x_max)
-    
-    nbins = bin_end - bin_start #we want bind_width 1
-    
-    
-    fig = px.histogram(df, x=x_column, hover_data=['Sample Name'], nbins=nbins)
-    fig.update_layout(title=title, xaxis_title=x_column, yaxis_title="Frequency")
+def create_histogram(data, x_column, title):
+    if x_column not in data.assay().columns:
+        return empty_figure(title)
+
+    return data.cached(("histogram", x_column, BIN_WIDTH, title), lambda: build_histogram(data, x_column, title))
+
+
+def build_histogram(data, x_column, title):
+    # Bars come from the study's bin index, so clicks map back to exactly these bins
+    index = data.bin_index(x_column, BIN_WIDTH)
+
+    fig = go.Figure(go.Bar(x=index.centers, y=index.counts, width=BIN_WIDTH))
+    fig.update_layout(title=title, xaxis_title=x_column, yaxis_title="Frequency", bargap=0)
     
     return fig
 
+
+def sample_record(assay, row):
+    # Only the fields display_sample_info shows
+    return {field: assay[field].iat[row] for field in SAMPLE_INFO_FIELDS if field in assay.columns}
+
 # App layout
 app.layout = html.Div([
     html.H1("RNA-Seq Data Visualization", style={
@@ -57,16 +109,18 @@ app.layout = html.Div([
                 'text-align': 'left',         # Align text to the left
                 'font-size': '24px'           # Font size adjustment
             }),
+
+    dcc.Dropdown(id='study',
+                 options=[{'label': accession, 'value': accession} for accession in STUDIES.available()],
+                 value=DEFAULT_STUDY,
+                 clearable=False,
+                 style={'width': '300px', 'margin-left': '22px'}),
     
     html.Div([
-        dcc.Graph(id='rna-contamination-histogram', 
-                  figure=create_histogram(data, 'Parameter Value[rRNA Contamination]', 'Histogram of RNA Contamination')),
-        dcc.Graph(id='qa-score-histogram', 
-                  figure=create_histogram(data, 'Parameter Value[QA Score]', 'Histogram of QA Score')),
-        dcc.Graph(id='spaceflight-histogram',
-                  figure=create_pie_chart(data2, 'Factor Value[Spaceflight]', 'Pie plot of factor value Spaceflight')),
-        dcc.Graph(id='dissectioncond-histogram',
-                  figure=create_pie_chart(data2, 'Factor Value[Dissection Condition]', 'Pie plot of Dissection Condition')),
+        dcc.Graph(id='rna-contamination-histogram'),
+        dcc.Graph(id='qa-score-histogram'),
+        dcc.Graph(id='spaceflight-histogram'),
+        dcc.Graph(id='dissectioncond-histogram'),
     ]),
 
     html.Div([
@@ -93,6 +147,25 @@ app.layout = html.Div([
     ])
 ])
 
+# Callback to draw the charts of the selected study; its tables are loaded on first use
+@app.callback(
+    [Output('rna-contamination-histogram', 'figure'),
+     Output('qa-score-histogram', 'figure'),
+     Output('spaceflight-histogram', 'figure'),
+     Output('dissectioncond-histogram', 'figure')],
+    [Input('study', 'value')]
+)
+def update_figures(study):
+    data = STUDIES.get(study)
+
+    return (
+        create_histogram(data, 'Parameter Value[rRNA Contamination]', 'Histogram of RNA Contamination'),
+        create_histogram(data, 'Parameter Value[QA Score]', 'Histogram of QA Score'),
+        create_pie_chart(data, 'Factor Value[Spaceflight]', 'Pie plot of factor value Spaceflight'),
+        create_pie_chart(data, 'Factor Value[Dissection Condition]', 'Pie plot of Dissection Condition'),
+    )
+
+
 # Callback to update the sample list when a bar is clicked
 @app.callback(
     [Output('sample-list', 'children'),
@@ -100,9 +173,10 @@ app.layout = html.Div([
      Output('last-clicked', 'data')],
     [Input('rna-contamination-histogram', 'clickData'),
      Input('qa-score-histogram', 'clickData')],
-    [State('last-clicked', 'data')]
+    [State('last-clicked', 'data'),
+     State('study', 'value')]
 )
-def display_samples_in_bin(rna_click, qa_click, last_clicked):
+def display_samples_in_bin(rna_click, qa_click, last_clicked, study):
     # Determine which histogram was clicked
     if rna_click and (last_clicked != 'rna'):
         click_data = rna_click
@@ -116,26 +190,24 @@ def display_samples_in_bin(rna_click, qa_click, last_clicked):
         # If no new click or same histogram clicked again, do nothing
         return "Click on a bar to see the sample names in that bin.", None, last_clicked
 
-    x_mid = click_data['points'][0]['x']
-    print(f"Click data: {click_data}")
-    print(f"Click data: {x_mid}")
-    # Assuming bin width is 1, calculate the start and end of the bin
-    bin_width = 1
-    x_bin_low = x_mid - (bin_width / 2)  # Start of the bin
-    print(f"x_bin_low: {x_bin_low}")
-    x_bin_high = x_mid + (bin_width / 2)  # End of the bin
-
-    # Filter the data for samples within that bin range
-    column = 'Parameter Value[rRNA Contamination]' if rna_click else 'Parameter Value[QA Score]'
-    
-    samples_in_bin = data[(data[column] >= x_bin_low) & (data[column] < x_bin_high)]
-    samples_in_bin_data = samples_in_bin.to_dict('records')
-    
+    # The clicked bar's center picks its bin; the index holds that bin's rows as one slice
+    data = STUDIES.get(study)
+    index = data.bin_index(column, BIN_WIDTH)
+    bin_number = index.bin_of(click_data['points'][0]['x'])
+    rows = index.rows(bin_number)
+
+    # The browser only gets the names of the listed samples and which bin they came from
+    names = data.assay()['Sample Name'].to_numpy()[rows[:SAMPLE_LIST_LIMIT]]
+    selection = {'study': study, 'column': column, 'bin': bin_number}
+
+    note = []
+    if len(rows) > SAMPLE_LIST_LIMIT:
+        note = [html.P(f"Showing the first {SAMPLE_LIST_LIMIT} of {len(rows)} samples in this bin.")]
 
     # Display sample names as clickable buttons
-    return html.Ul([
-    html.Li(html.Button(sample['Sample Name'], 
-                        id={'type': 'sample-button', 'index': sample['Sample Name']}, 
+    return html.Div(note + [html.Ul([
+    html.Li(html.Button(name, 
+                        id={'type': 'sample-button', 'index': name}, 
                         style={'background-color': '#86c7eb',  # Green background
                                'color': 'white',               # White text
                                'padding': '10px 20px',          # Padding
@@ -143,8 +215,8 @@ def display_samples_in_bin(rna_click, qa_click, last_clicked):
                                'border-radius': '5px',          # Rounded corners
                                'cursor': 'pointer',             # Pointer cursor on hover
                                'margin': '5px'}))               # Space between buttons
-    for sample in samples_in_bin_data
-    ], style={'list-style-type': 'none'}), samples_in_bin_data, last_clicked
+    for name in names
+    ], style={'list-style-type': 'none'})]), selection, last_clicked
 
 
 
@@ -153,32 +225,35 @@ def display_samples_in_bin(rna_click, qa_click, last_clicked):
     [Input({'type': 'sample-button', 'index': ALL}, 'n_clicks')],
     [State('samples-in-bin', 'data')]
 )
-def display_sample_info(n_clicks_list, samples_in_bin_data):
+def display_sample_info(n_clicks_list, selection):
     if not any(n_clicks_list):
         return "Click on a sample to see detailed information."
     
     # Find which button was clicked
     clicked_index = [i for i, clicks in enumerate(n_clicks_list) if clicks]
     
-    if clicked_index and samples_in_bin_data:
-        clicked_sample = samples_in_bin_data[clicked_index[0]]
+    if clicked_index and selection:
+        # Fetch the clicked sample's details from the bin it was listed from
+        data = STUDIES.get(selection['study'])
+        rows = data.bin_index(selection['column'], BIN_WIDTH).rows(selection['bin'])
+        clicked_sample = sample_record(data.assay(), rows[clicked_index[0]])
         return html.Div([
-            html.P(f"Sample Name: {clicked_sample['Sample Name']}"),
-            html.P(f"QA Instrument: {clicked_sample['Parameter Value[QA Instrument]']}"),
-            html.P(f"Parameter Value[QA Assay]: {clicked_sample['Protocol REF']}"),
-            html.P(f"Unit: {clicked_sample['Unit']}"),
-            html.P(f"Term Source REF: {clicked_sample['Term Source REF']}"),
-            html.P(f"Term Accession Number: {clicked_sample['Term Accession Number']}"),
-            html.P(f"Extract Name: {clicked_sample['Extract Name']}"),
-            html.P(f"Protocol REF: {clicked_sample['Protocol REF']}"),
-            html.P(f"Spike-in Quality Control: {clicked_sample['Parameter Value[Spike-in Quality Control]']}"),
-            html.P(f"Term Source REF: {clicked_sample['Term Source REF']}"),
+            html.P(f"Sample Name: {clicked_sample.get('Sample Name', 'N/A')}"),
+            html.P(f"QA Instrument: {clicked_sample.get('Parameter Value[QA Instrument]', 'N/A')}"),
+            html.P(f"Parameter Value[QA Assay]: {clicked_sample.get('Protocol REF', 'N/A')}"),
+            html.P(f"Unit: {clicked_sample.get('Unit', 'N/A')}"),
+            html.P(f"Term Source REF: {clicked_sample.get('Term Source REF', 'N/A')}"),
+            html.P(f"Term Accession Number: {clicked_sample.get('Term Accession Number', 'N/A')}"),
+            html.P(f"Extract Name: {clicked_sample.get('Extract Name', 'N/A')}"),
+            html.P(f"Protocol REF: {clicked_sample.get('Protocol REF', 'N/A')}"),
+            html.P(f"Spike-in Quality Control: {clicked_sample.get('Parameter Value[Spike-in Quality Control]', 'N/A')}"),
+            html.P(f"Term Source REF: {clicked_sample.get('Term Source REF', 'N/A')}"),
         
-            html.P(f"Spike-in Mix Number: {clicked_sample['Parameter Value[Spike-in Mix Number]']}"),
-            html.P(f"library selection: {clicked_sample['Parameter Value[library selection]']}"),
-            html.P(f"library layout: {clicked_sample['Parameter Value[library layout]']}"),
-            html.P(f"stranded: {clicked_sample['Parameter Value[stranded]']}"),
-            html.P(f"rRNA Contamination: {clicked_sample['Parameter Value[rRNA Contamination]']}"),
+            html.P(f"Spike-in Mix Number: {clicked_sample.get('Parameter Value[Spike-in Mix Number]', 'N/A')}"),
+            html.P(f"library selection: {clicked_sample.get('Parameter Value[library selection]', 'N/A')}"),
+            html.P(f"library layout: {clicked_sample.get('Parameter Value[library layout]', 'N/A')}"),
+            html.P(f"stranded: {clicked_sample.get('Parameter Value[stranded]', 'N/A')}"),
+            html.P(f"rRNA Contamination: {clicked_sample.get('Parameter Value[rRNA Contamination]', 'N/A')}"),
             # Add other fields as needed
         ])
     
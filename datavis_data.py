@@ -0,0 +1,345 @@
+"""
+Study data for the dashboards in datavis.py.
+
+Studies are ISA-Tab metadata folders laid out as downloaded from OSDR:
+
+    <DATAVIS_DATA_DIR>/<accession>/metadata/s_<accession>.txt
+    <DATAVIS_DATA_DIR>/<accession>/metadata/a_<accession>_<assay>.txt
+
+A study's tables are parsed on first access only. The parsed columns are then
+written to DATAVIS_CACHE_DIR as one .npy file per column, and later loads
+memory-map those instead of parsing the TSVs again. The cache is rebuilt
+whenever a source file's size or mtime changes. The most recently used
+DATAVIS_MAX_STUDIES studies are also kept in memory.
+"""
+
+from collections import OrderedDict
+import threading
+import glob
+import json
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+DATAVIS_DATA_DIR = os.getenv("DATAVIS_DATA_DIR", ".")
+DATAVIS_CACHE_DIR = os.getenv("DATAVIS_CACHE_DIR", ".datavis_cache")
+DATAVIS_MAX_STUDIES = int(os.getenv("DATAVIS_MAX_STUDIES", "16"))
+
+CACHE_VERSION = 1
+
+def read_table(path: str) -> pd.DataFrame:
+
+    table = pd.read_csv(path, sep='\t', index_col=False)
+    table.columns = table.columns.str.strip()
+
+    return table
+
+def source_signature(path: str) -> dict:
+
+    stat = os.stat(path)
+
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+def save_columns(table: pd.DataFrame, directory: str, source: dict):
+
+    """
+    Write `table` as one .npy file per column. Numeric and boolean columns keep
+    their dtype. Other columns with few distinct values are stored as integer
+    codes into a list of values kept in the manifest; the rest are stored as
+    fixed-width unicode with a mask of the missing values. Every file can be
+    memory-mapped.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    columns = []
+
+    for position, name in enumerate(table.columns):
+
+        series = table.iloc[:, position]
+        column = {"name": name, "file": f"c{position}.npy"}
+
+        if series.dtype.kind in "biuf":
+            np.save(os.path.join(directory, column["file"]), series.to_numpy())
+            columns.append(column)
+            continue
+
+        codes, values = pd.factorize(series)
+
+        if len(values) <= len(series) // 2:
+            column["values"] = values.tolist()
+            np.save(os.path.join(directory, column["file"]), codes.astype(np.int32))
+        else:
+            missing = series.isna().to_numpy()
+            np.save(os.path.join(directory, column["file"]), series.where(~missing, "").astype(str).to_numpy(dtype=str))
+
+            if missing.any():
+                column["missing"] = f"m{position}.npy"
+                np.save(os.path.join(directory, column["missing"]), missing)
+
+        columns.append(column)
+
+    manifest = {"version": CACHE_VERSION, "source": source, "rows": len(table), "columns": columns}
+
+    # The manifest is written last, so an interrupted save is never mistaken for a complete one
+    temporary = os.path.join(directory, "manifest.json.tmp")
+
+    with open(temporary, "w") as f:
+        json.dump(manifest, f)
+
+    os.replace(temporary, os.path.join(directory, "manifest.json"))
+
+def load_columns(directory: str, source: dict):
+
+    """
+    The cached table in `directory`, or None if it is missing or stale.
+    """
+
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("version") != CACHE_VERSION or manifest.get("source") != source:
+        return None
+
+    data = {}
+
+    for column in manifest["columns"]:
+
+        values = np.load(os.path.join(directory, column["file"]), mmap_mode="r")
+
+        if "values" in column:
+            # Missing values have code -1, which picks the NaN appended to the lookup
+            values = np.array([*column["values"], np.nan], dtype=object)[values]
+
+        elif values.dtype.kind == "U":
+
+            values = values.astype(object)
+
+            if "missing" in column:
+                values[np.load(os.path.join(directory, column["missing"]))] = np.nan
+
+        data[column["name"]] = values
+
+    return pd.DataFrame(data, columns=[column["name"] for column in manifest["columns"]])
+
+def bin_edges(values: np.ndarray, width: float = 1.0) -> np.ndarray:
+
+    """
+    Edges of `width`-wide bins from the floor of the minimum to the ceiling of the maximum.
+    """
+
+    if values.size == 0:
+        return np.array([0.0, width])
+
+    start = math.floor(values.min() / width) * width
+    count = max(1, math.ceil((values.max() - start) / width))
+
+    return start + width * np.arange(count + 1)
+
+class BinIndex:
+
+    """
+    Rows of a numeric column grouped into fixed-width bins.
+
+    The column's row positions are sorted once by value, and `offsets[i]` is
+    where bin i starts in that order, so a bin's rows are one slice and the
+    bin containing a value is one binary search over the edges. Bins are
+    half-open like np.histogram, except the last one, which includes its
+    upper edge.
+    """
+
+    def __init__(self, values, width: float = 1.0):
+
+        values = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=float)
+        present = np.flatnonzero(~np.isnan(values))
+
+        self.order = present[np.argsort(values[present], kind="stable")]
+        self.values = values[self.order]
+        self.edges = bin_edges(self.values, width)
+        self.offsets = np.searchsorted(self.values, self.edges, side="left")
+        self.offsets[-1] = len(self.values)
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.diff(self.offsets)
+
+    @property
+    def centers(self) -> np.ndarray:
+        return (self.edges[:-1] + self.edges[1:]) / 2
+
+    def bin_of(self, value: float) -> int:
+
+        position = int(np.searchsorted(self.edges, value, side="right")) - 1
+
+        return min(max(position, 0), len(self.edges) - 2)
+
+    def rows(self, bin_number: int) -> np.ndarray:
+
+        """
+        Row positions of the samples in bin `bin_number`, in ascending order of value.
+        """
+
+        return self.order[self.offsets[bin_number]:self.offsets[bin_number + 1]]
+
+class Study:
+
+    """
+    One study's sample table and assay tables (keyed by assay file name).
+    """
+
+    def __init__(self, accession: str, samples: pd.DataFrame, assays: dict):
+
+        self.accession = accession
+        self.samples = samples
+        self.assays = assays
+        self._derived = {}
+
+    def assay(self, name: str = None) -> pd.DataFrame:
+
+        """
+        The assay table whose file name contains `name`, or the first one.
+        """
+
+        for assay_name in sorted(self.assays):
+            if name is None or name in assay_name:
+                return self.assays[assay_name]
+
+        raise KeyError(f"No assay matching {name!r} in {self.accession}")
+
+    def cached(self, key, build):
+
+        """
+        A value derived from this study's tables (a bin index, a figure),
+        built by `build()` on first use of `key` and kept for as long as the
+        study stays loaded.
+        """
+
+        value = self._derived.get(key)
+
+        if value is None:
+            value = self._derived[key] = build()
+
+        return value
+
+    def bin_index(self, column: str, width: float = 1.0, assay: str = None) -> BinIndex:
+
+        """
+        The BinIndex of an assay column, built once so the histogram and its
+        click handler always see the same bins.
+        """
+
+        return self.cached(("bins", assay, column, width), lambda: BinIndex(self.assay(assay)[column], width))
+
+class StudyStore:
+
+    """
+    Lazily loaded studies with an in-memory LRU on top of the on-disk column cache.
+    """
+
+    def __init__(self, data_dir: str = DATAVIS_DATA_DIR, cache_dir: str = DATAVIS_CACHE_DIR, max_studies: int = DATAVIS_MAX_STUDIES):
+
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.max_studies = max_studies
+
+        self._studies = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+
+        self.loads = 0
+        self.cache_loads = 0
+
+    def available(self) -> list:
+
+        """
+        Accessions that have a sample table under `data_dir`.
+        """
+
+        pattern = os.path.join(self.data_dir, "*", "metadata", "s_*.txt")
+
+        return sorted({os.path.basename(os.path.dirname(os.path.dirname(path))) for path in glob.glob(pattern)})
+
+    def get(self, accession: str) -> Study:
+
+        with self._lock:
+
+            study = self._studies.get(accession)
+
+            if study is not None:
+                self._studies.move_to_end(accession)
+                return study
+
+            # Concurrent requests for the same study wait for one load instead of each parsing it
+            loading = self._loading.setdefault(accession, threading.Lock())
+
+        with loading:
+
+            with self._lock:
+                study = self._studies.get(accession)
+
+            if study is not None:
+                return study
+
+            try:
+                study = self._load(accession)
+            finally:
+                with self._lock:
+                    self._loading.pop(accession, None)
+
+            with self._lock:
+
+                self._studies[accession] = study
+
+                while len(self._studies) > self.max_studies:
+                    self._studies.popitem(last=False)
+
+        return study
+
+    def evict(self, accession: str = None):
+
+        with self._lock:
+            if accession is None:
+                self._studies.clear()
+            else:
+                self._studies.pop(accession, None)
+
+    def _load(self, accession: str) -> Study:
+
+        metadata = os.path.join(self.data_dir, accession, "metadata")
+        sample_files = sorted(glob.glob(os.path.join(metadata, "s_*.txt")))
+
+        if not sample_files:
+            raise KeyError(f"No ISA-Tab sample table for {accession} in {metadata}")
+
+        samples = self._table(accession, sample_files[0])
+        assays = {
+            os.path.basename(path): self._table(accession, path)
+            for path in sorted(glob.glob(os.path.join(metadata, "a_*.txt")))
+        }
+
+        self.loads += 1
+
+        return Study(accession, samples, assays)
+
+    def _table(self, accession: str, path: str) -> pd.DataFrame:
+
+        source = source_signature(path)
+        directory = os.path.join(self.cache_dir, accession, os.path.splitext(os.path.basename(path))[0])
+
+        table = load_columns(directory, source)
+
+        if table is not None:
+            self.cache_loads += 1
+            return table
+
+        table = read_table(path)
+        save_columns(table, directory, source)
+
+        return table
+
+STUDIES = StudyStore()